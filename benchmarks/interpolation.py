@@ -0,0 +1,83 @@
+""" Measure interpolation of configurations with many keys.
+
+Compares `JinjaInterpolationSection` with the previous implementation which
+compiled every expression and collected the context for every match.
+
+Usage: ::
+
+    python benchmarks/interpolation.py [--keys 500 1000 2000] [--json]
+
+"""
+import json
+import sys
+import time
+from argparse import ArgumentParser
+from os import path as op
+
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+from starter.core import ( # noqa
+    JinjaInterpolationNamespace, JinjaInterpolationSection)
+
+
+class UncachedSection(JinjaInterpolationSection):
+
+    def __interpolate__(self, math):
+        from jinja2 import Template as JinjaTemplate
+
+        t = JinjaTemplate(math.group(0))
+        return t.render(**dict(self.items(raw=True)))
+
+
+class UncachedNamespace(JinjaInterpolationNamespace):
+
+    section_type = UncachedSection
+
+
+def config(keys):
+    """ Generate chains of interpolated keys like py-makefile's params. """
+    lines = ['AUTHOR = {{_USER}}', 'PROJECT_NAME = Project']
+    for n in range(keys):
+        lines.append(
+            'PACKAGE{0} = {{{{PROJECT_NAME|lower}}}}_{0}'.format(n))
+        lines.append(
+            'URL{0} = https://github.com/{{{{AUTHOR}}}}/{{{{PACKAGE{0}}}}}'
+            .format(n))
+    return '\n'.join(lines)
+
+
+def measure(namespace, source):
+    parser = namespace(_USER='user')
+    parser.parse(source)
+    start = time.time()
+    dict(parser.default.items())
+    return (time.time() - start) * 1000
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--keys', type=int, nargs='+', default=[500, 1000, 2000])
+    parser.add_argument('--json', action='store_true')
+    params = parser.parse_args()
+
+    results = []
+    for keys in params.keys:
+        source = config(keys)
+        results.append(dict(
+            keys=keys * 2,
+            cached_ms=measure(JinjaInterpolationNamespace, source),
+            uncached_ms=measure(UncachedNamespace, source)))
+
+    if params.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{0:>8} {1:>14} {2:>14}'.format('keys', 'uncached', 'cached'))
+    for r in results:
+        print('{keys:>8} {uncached_ms:12.1f}ms {cached_ms:12.1f}ms'.format(
+            **r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+""" Compare strategies of static files materialization.
+
+Generates a template with large static assets and pastes it with every
+strategy (see `starter --materialize`).
+
+Usage: ::
+
+    python benchmarks/materialize.py [--files 20] [--size 8] [--json]
+
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from os import path as op
+
+CACHEDIR = tempfile.mkdtemp()
+
+# Configure the cache before starter is imported (don't use a warm cache)
+os.environ['STARTER_CACHE'] = CACHEDIR
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+from starter.core import Template # noqa
+from starter.fs import STRATEGIES # noqa
+
+
+def make_template(path, files, size):
+    os.makedirs(op.join(path, 'assets'))
+    with open(op.join(path, 'starter.ini'), 'w') as f:
+        f.write('[params]\ndescription = Large assets\n')
+    chunk = os.urandom(1024 * 1024)
+    for n in range(files):
+        name = op.join(path, 'assets', 'asset{0}.bin'.format(n))
+        with open(name, 'wb') as f:
+            for _ in range(size):
+                f.write(chunk)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--size', type=int, default=8, help='File size (MB)')
+    parser.add_argument('--dir', help='Directory for targets')
+    parser.add_argument('--json', action='store_true')
+    params = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(dir=params.dir)
+    results = {}
+    try:
+        make_template(op.join(tmpdir, 'assets'), params.files, params.size)
+        template = Template('assets', op.join(tmpdir, 'assets'))
+        for strategy in sorted(STRATEGIES):
+            target = op.join(tmpdir, strategy)
+            start = time.time()
+            template.paste_files(dict(_TRGDIR=target), strategy=strategy)
+            results[strategy] = (time.time() - start) * 1000
+    finally:
+        shutil.rmtree(tmpdir)
+        shutil.rmtree(CACHEDIR)
+
+    if params.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    total = params.files * params.size
+    for strategy, ms in sorted(results.items(), key=lambda r: r[1]):
+        print('{0:<10} {1:10.1f}ms {2:10.1f}MB/s'.format(
+            strategy, ms, total / (ms / 1000.0)))
+
+
+if __name__ == '__main__':
+    main()
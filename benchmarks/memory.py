@@ -0,0 +1,90 @@
+""" Measure peak memory of rendering large files.
+
+Renders a template with a loop to files of growing size, both to a string
+(`Template.render`) and streamed (`starter.core.render_file`).
+
+Usage: ::
+
+    python benchmarks/memory.py [--rows 10000 100000 1000000] [--json]
+
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from os import path as op
+
+CACHEDIR = tempfile.mkdtemp()
+
+# Configure the cache before starter is imported (don't use a warm cache)
+os.environ['STARTER_CACHE'] = CACHEDIR
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+from starter.core import get_environment, render_file # noqa
+
+
+TEMPLATE = """{% for n in range(rows) %}
+row {{ n }}: {{ name }} -- {{ n * 2 }} -- {{ '%08x' % n }}
+{%- endfor %}
+"""
+
+
+def render_string(path, target, context):
+    body = get_environment(path).get_template('big.j2').render(**context)
+    with open(target, 'w') as f:
+        f.write(body)
+
+
+def peak(func, *args):
+    """ Return peak of traced memory (MB). """
+    tracemalloc.start()
+    func(*args)
+    _, result = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result / 1024.0 / 1024.0
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--json', action='store_true')
+    params = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    results = []
+    try:
+        with open(op.join(tmpdir, 'big.j2'), 'w') as f:
+            f.write(TEMPLATE)
+
+        # Warm up the environment (compile the template)
+        get_environment(tmpdir).get_template('big.j2')
+
+        target = op.join(tmpdir, 'big')
+        for rows in params.rows:
+            context = dict(rows=rows, name='benchmark')
+            string = peak(render_string, tmpdir, target, context)
+            stream = peak(render_file, tmpdir, 'big.j2', target, context)
+            results.append(dict(
+                rows=rows, size_mb=os.path.getsize(target) / 1024.0 / 1024.0,
+                render_mb=string, stream_mb=stream))
+    finally:
+        shutil.rmtree(tmpdir)
+        shutil.rmtree(CACHEDIR)
+
+    if params.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{0:>10} {1:>10} {2:>12} {3:>12}'.format(
+        'rows', 'output', 'render peak', 'stream peak'))
+    for r in results:
+        print('{rows:>10} {size_mb:8.1f}MB {render_mb:10.2f}MB '
+              '{stream_mb:10.2f}MB'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+""" Measure cold start latency of the starter command.
+
+Every command is run in a fresh interpreter. Wall time is the median of
+several runs, import time is taken from `python -X importtime`.
+
+Usage: ::
+
+    python benchmarks/startup.py [-n RUNS] [--json]
+
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from os import path as op
+
+
+ROOT = op.dirname(op.dirname(op.abspath(__file__)))
+
+COMMANDS = (
+    ('version', ['--version']),
+    ('list', ['--list']),
+    ('paste', ['py-package', '{target}']),
+)
+
+
+def run(args, env, **params):
+    return subprocess.run(
+        [sys.executable] + args, cwd=ROOT, env=env, check=True,
+        stdout=subprocess.DEVNULL, **params)
+
+
+def import_time(args, env):
+    """ Return cumulative import time of the top-level modules (ms). """
+    proc = run(['-X', 'importtime', '-m', 'starter.main'] + args, env,
+               stderr=subprocess.PIPE, universal_newlines=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[12:].split('|')
+        if not name.startswith('  '):
+            modules[name.strip()] = int(cumulative) / 1000.0
+    return modules
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', dest='runs', type=int, default=10)
+    parser.add_argument('--json', action='store_true')
+    params = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    env = dict(os.environ, STARTER_CACHE=op.join(tmpdir, 'cache'))
+    results = {}
+    try:
+        for name, args in COMMANDS:
+            args = [a.format(target=op.join(tmpdir, 'target')) for a in args]
+            timings = []
+            for _ in range(params.runs):
+                start = time.time()
+                run(['-m', 'starter.main'] + args, env)
+                timings.append((time.time() - start) * 1000)
+
+            modules = import_time(args, env)
+            results[name] = dict(
+                wall_ms=sorted(timings)[len(timings) // 2],
+                min_ms=min(timings),
+                import_ms=sum(modules.values()),
+                imports=sorted(
+                    modules.items(), key=lambda m: m[1], reverse=True)[:5])
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if params.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name, r in results.items():
+        print('{0:<10} wall {1:8.1f}ms  min {2:8.1f}ms  imports {3:8.1f}ms'
+              .format(name, r['wall_ms'], r['min_ms'], r['import_ms']))
+        for module, ms in r['imports']:
+            print('{0:>14} {1:8.1f}ms'.format(module, ms))
+
+
+if __name__ == '__main__':
+    main()
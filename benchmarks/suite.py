@@ -0,0 +1,190 @@
+""" Benchmark starter on synthetic templates.
+
+Generates a directory of templates with configurable size and times the
+key operations: scanning templates, listing, resolving includes and
+pasting. Results are written as JSON and can be compared with a baseline
+to detect regressions.
+
+Usage: ::
+
+    python benchmarks/suite.py --files 1000 --depth 4 --output results.json
+    python benchmarks/suite.py --baseline results.json --threshold 0.2
+
+"""
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+from os import path as op
+
+ROOT = op.dirname(op.dirname(op.abspath(__file__)))
+TMPDIR = tempfile.mkdtemp()
+
+# Configure the cache before starter is imported
+os.environ['STARTER_CACHE'] = op.join(TMPDIR, 'cache')
+sys.path.insert(0, ROOT)
+
+from starter import __version__ # noqa
+from starter.core import Starter, Template # noqa
+
+
+TEMPLATE = """# {{ PROJECT_NAME }}
+{% for n in range(10) %}
+{{ n }}: {{ AUTHOR_NAME }} {{ _TRGDIR }} {{ n * 2 }}
+{%- endfor %}
+"""
+
+
+def generate(path, params):
+    """ Generate templates directory.
+
+    `tpl0` includes `tpl1`, ..., up to `includes` levels, other templates
+    are standalone.
+
+    """
+    for n in range(params.templates):
+        tpl = op.join(path, 'tpl{0}'.format(n))
+        os.makedirs(tpl)
+        with open(op.join(tpl, 'starter.ini'), 'w') as f:
+            f.write('PROJECT_NAME = project{0}\nAUTHOR_NAME = {{{{_USER}}}}\n'
+                    '\n[params]\ndescription = Template {0}\n'.format(n))
+            if n + 1 < params.includes:
+                f.write('include = tpl{0}\n'.format(n + 1))
+
+        if n >= max(params.includes, 1):
+            continue
+
+        templated = int(params.files * params.ratio)
+        for k in range(params.files):
+            dirname = op.join(tpl, *[
+                'd{0}'.format((k + level) % 3) for level in range(
+                    k % (params.depth + 1))])
+            if not op.isdir(dirname):
+                os.makedirs(dirname)
+            ext = '.j2' if k < templated else '.txt'
+            with open(op.join(dirname, 'f{0}{1}'.format(k, ext)), 'w') as f:
+                f.write(TEMPLATE if ext == '.j2' else TEMPLATE * 4)
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    timings.sort()
+    return dict(
+        min_ms=timings[0] * 1000, median_ms=timings[len(timings) // 2] * 1000)
+
+
+def run(params):
+    tmpldir = op.join(TMPDIR, 'templates')
+    generate(tmpldir, params)
+
+    def options(**opts):
+        defaults = dict(
+            TEMPLATES=['tpl0'], TARGET=op.join(TMPDIR, 'target'),
+            context=[], config=None, interactive=False)
+        defaults.update(opts)
+        return Namespace(**defaults)
+
+    def paste(**opts):
+        target = op.join(TMPDIR, 'target')
+        if op.isdir(target) and not opts.get('update'):
+            shutil.rmtree(target)
+        Starter(options(TARGET=target), tmpldir, **opts).copy()
+
+    def list_templates():
+        for t in Starter(options(), tmpldir).iterate_templates():
+            t.params.get('description')
+
+    results = {}
+    results['scan_cold'] = measure(lambda: Template.scan(tmpldir), 1)
+    results['scan'] = measure(lambda: Template.scan(tmpldir), params.repeat)
+    results['list'] = measure(list_templates, params.repeat)
+    results['prepare_templates'] = measure(
+        lambda: Starter(options(), tmpldir).prepare_templates(),
+        params.repeat)
+    results['paste_cold'] = measure(paste, 1)
+    results['paste'] = measure(paste, params.repeat)
+    results['paste_workers'] = measure(
+        lambda: paste(workers=params.workers), params.repeat)
+    results['paste_update'] = measure(
+        lambda: paste(update=True), params.repeat)
+    results['paste_cached'] = measure(
+        lambda: paste(cache_outputs=True), params.repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ Return a list of regressions. """
+    regressions = []
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if not base:
+            continue
+        ratio = result['median_ms'] / max(base['median_ms'], 1e-6)
+        if ratio > 1 + threshold:
+            regressions.append((name, base['median_ms'], result['median_ms']))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=200,
+                        help='Files in a template')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Directories depth')
+    parser.add_argument('--ratio', type=float, default=0.5,
+                        help='Ratio of Jinja templates (.j2) to all files')
+    parser.add_argument('--includes', type=int, default=3,
+                        help='Depth of the include chain')
+    parser.add_argument('--templates', type=int, default=50,
+                        help='Templates in the directory')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write JSON results to the file')
+    parser.add_argument('--baseline', help='Compare with the JSON results')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed slowdown (0.2 is 20%%)')
+    params = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    try:
+        results = run(params)
+    finally:
+        shutil.rmtree(TMPDIR)
+
+    report = dict(
+        meta=dict(
+            version=__version__, python=platform.python_version(),
+            platform=platform.platform(), params=dict(
+                (k, v) for k, v in vars(params).items()
+                if k not in ('output', 'baseline', 'threshold'))),
+        results=results)
+
+    if params.output:
+        with open(params.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    for name, r in results.items():
+        print('{0:<20} min {1:10.2f}ms  median {2:10.2f}ms'.format(
+            name, r['min_ms'], r['median_ms']))
+
+    if params.baseline:
+        with open(params.baseline) as f:
+            regressions = compare(results, json.load(f), params.threshold)
+        for name, base, value in regressions:
+            print('REGRESSION {0}: {1:.2f}ms -> {2:.2f}ms'.format(
+                name, base, value))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
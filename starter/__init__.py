@@ -7,7 +7,7 @@ Similar to the template part of PasteScript, but uses Jinja templates.
 :license: BSD, see LICENSE for more details.
 
 """
-from os import getcwd, path as op
+from os import environ, getcwd, path as op
 
 
 # Module information
@@ -23,6 +23,9 @@ __license__ = "BSD"
 # ====================
 
 CFGFILE = 'starter.ini'
+BUNDLE_EXT = '.zip'
 CURDIR = getcwd()
 BUILTIN_TMPLDIR = op.relpath(op.join(op.dirname(__file__), 'templates'))
 HOME_TMPLDIR_NAME = '.starter'
+CACHEDIR = environ.get('STARTER_CACHE', op.join(
+    environ.get('HOME', '~'), HOME_TMPLDIR_NAME, 'cache'))
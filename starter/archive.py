@@ -0,0 +1,128 @@
+""" Paste templates to tar or zip archives.
+
+Files are added to the archive as they are pasted, nothing is written to
+the target directory: ::
+
+    $ starter py-package myproject --output-archive myproject.tar.gz
+    $ starter py-package myproject --output-archive - | ssh host tar -x
+
+The archive format is chosen by the extension (`.zip`, `.tar`, `.tar.gz`,
+`.tgz`, `.tar.bz2`, `.tar.xz`), `-` writes a tar stream to stdout.
+
+"""
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from io import BytesIO
+from os import path as op
+
+from .core import FS
+
+
+# Permissions of rendered files
+FILE_MODE = 0o644
+
+TAR_MODES = (
+    ('.tar.gz', 'w:gz'), ('.tgz', 'w:gz'), ('.tar.bz2', 'w:bz2'),
+    ('.tar.xz', 'w:xz'), ('.tar', 'w'))
+
+
+class ArchiveFS(FS):
+
+    """ Write pasted files to an archive.
+
+    Paths in the archive are relative to the root (the paste target).
+    Rendered files are buffered one by one, static files are streamed
+    from the disk with their permissions.
+
+    """
+
+    def __init__(self, filename, root):
+        self.filename = filename
+        self.root = op.abspath(root)
+        self.lock = threading.Lock()
+        self.sizes = {}
+        self.zip = self.tar = None
+
+        if filename == '-':
+            self.tar = tarfile.open(
+                fileobj=getattr(sys.stdout, 'buffer', sys.stdout), mode='w|')
+
+        elif filename.lower().endswith('.zip'):
+            self.zip = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+
+        else:
+            mode = next((
+                mode for ext, mode in TAR_MODES
+                if filename.lower().endswith(ext)), None)
+            if mode is None:
+                raise ValueError(
+                    'Unsupported archive format: {0}'.format(filename))
+            self.tar = tarfile.open(filename, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        (self.zip or self.tar).close()
+
+    def arcname(self, path):
+        return op.relpath(op.abspath(path), self.root).replace(op.sep, '/')
+
+    def make_directory(self, path):
+        pass
+
+    def copy_file(self, from_path, to_path, strategy='copy'):
+        self.sizes[to_path] = op.getsize(from_path)
+        with self.lock:
+            if self.zip:
+                self.zip.write(from_path, self.arcname(to_path))
+            else:
+                self.tar.add(from_path, self.arcname(to_path), filter=owner)
+
+    def open_file(self, path, mode=None):
+        return ArchiveFile(self, path, FILE_MODE if mode is None else mode)
+
+    def write(self, path, body, mode):
+        """ Add file to the archive. """
+        name = self.arcname(path)
+        with self.lock:
+            if self.zip:
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = (0o100000 | mode) << 16
+                self.zip.writestr(info, body)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size, info.mode, info.mtime = len(body), mode, time.time()
+                self.tar.addfile(info, BytesIO(body))
+        self.sizes[path] = len(body)
+
+    def getsize(self, path):
+        return self.sizes[path]
+
+
+def owner(info):
+    """ Don't keep owners of static files. """
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info
+
+
+class ArchiveFile(BytesIO):
+
+    """ Add content to the archive when closed. """
+
+    def __init__(self, fs, path, mode):
+        BytesIO.__init__(self)
+        self.fs, self.path, self.mode = fs, path, mode
+
+    def close(self):
+        if not self.closed:
+            self.fs.write(self.path, self.getvalue(), self.mode)
+        BytesIO.close(self)
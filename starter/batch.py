@@ -0,0 +1,110 @@
+""" Generate many projects from one file of contexts. """
+
+import csv
+import json
+import logging
+import time
+from os import path as op
+
+from . import CURDIR
+from .pool import Pool
+
+
+def read_projects(filename):
+    """ Read projects contexts from JSONL, CSV or INI file.
+
+    Every project should define `TARGET` (INI sections names are used as
+    targets by default).
+
+    :returns: A list of dictionaries
+
+    """
+    ext = op.splitext(filename)[1].lower()
+
+    if ext == '.csv':
+        with open(filename) as f:
+            return [dict(row) for row in csv.DictReader(f)]
+
+    if ext == '.ini':
+        from inirama import Namespace
+
+        parser = Namespace()
+        parser.silent_read = False
+        parser.read(filename)
+        projects = []
+        for name, section in parser.sections.items():
+            if name == parser.default_section:
+                continue
+            project = dict(TARGET=name)
+            project.update(section)
+            projects.append(project)
+        return projects
+
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def paste_project(templates, context, strategy='copy'):
+    """ Paste templates to one project.
+
+    Errors are returned as strings, so results can be collected from
+    process pools.
+
+    :returns: A tuple (target, files, seconds, error)
+
+    """
+    from .core import FS
+    from .plan import Plan
+
+    start, files, error = time.time(), 0, None
+    target = context['_TRGDIR']
+    try:
+        if not target:
+            raise ValueError('Project target is not defined.')
+        FS.make_directory(target)
+        plan = Plan(target)
+        for t in templates:
+            plan.add(t, context)
+        with Pool() as pool:
+            files = sum(
+                len(ff) for ff in plan.apply(context, pool, strategy).values())
+    except Exception as e: # noqa
+        error = str(e) or e.__class__.__name__
+    return target, files, time.time() - start, error
+
+
+def batch(starter, projects, workers=1, processes=False):
+    """ Paste starter's templates for every project.
+
+    Templates are resolved and compiled once, projects are pasted in the
+    pool (every project is pasted by one worker).
+
+    :returns: A list of results (see :func:`paste_project`)
+
+    """
+    templates = starter.prepare_templates()
+    for t in templates:
+        t.compile()
+    starter.provide(starter.get_names(templates))
+
+    jobs = []
+    for project in projects:
+        project = dict(project)
+        target = project.pop('TARGET', None)
+        project['_TRGDIR'] = op.join(CURDIR, str(target)) if target else ''
+        project['templates'] = ','.join(t.name for t in templates)
+        context = starter.get_context(**project)
+        jobs.append((target, paste_project, (
+            templates, context, starter.option('materialize')), True))
+
+    with Pool(workers, processes) as pool:
+        results = pool.run(jobs)
+
+    for target, files, seconds, error in results:
+        if error:
+            logging.error('FAIL {0}: {1}'.format(target, error))
+        else:
+            logging.warning('OK   {0} ({1} files, {2:.3f}s)'.format(
+                target, files, seconds))
+
+    return results
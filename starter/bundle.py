@@ -0,0 +1,168 @@
+""" Pack templates to archives with precompiled Jinja modules.
+
+Bundle is a zip archive: ::
+
+    index.json                  -- roots and templates metadata
+    <template>/starter.ini      -- template's configuration
+    <template>/files/<path>     -- static files and templates sources
+    <template>/jinja/tmpl_*.py  -- templates compiled to python modules
+
+"""
+import json
+import logging
+import os
+import shutil
+import zipfile
+from os import path as op
+
+from . import CFGFILE
+from .core import BINARY, STATIC, TEMPLATE, TEXT, Template
+
+
+INDEX = 'index.json'
+ARCHIVES = {}
+
+
+def get_archive(filename):
+    """ Open the archive once per process (again when it's changed).
+
+    Compiled templates of a changed archive are loaded again too.
+
+    """
+    info = os.stat(filename)
+    stamp = info.st_mtime, info.st_size
+    cached = ARCHIVES.get(filename)
+    if cached is None or cached[0] != stamp:
+        if cached is not None:
+            forget(filename)
+        cached = ARCHIVES[filename] = stamp, zipfile.ZipFile(filename)
+    return cached[1]
+
+
+def forget(filename):
+    """ Drop Jinja environments and import caches of the archive. """
+    import sys
+    import zipimport
+    from .core import ENVIRONMENTS
+
+    prefix = filename + os.sep
+    for cache in (
+            ENVIRONMENTS, sys.path_importer_cache,
+            getattr(zipimport, '_zip_directory_cache', {})):
+        for path in list(cache):
+            if path == filename or path.startswith(prefix):
+                cache.pop(path, None)
+
+
+class BundleTemplate(Template):
+
+    """ Template which is loaded from a bundle without extraction. """
+
+    # Update mode is not supported
+    updatable = False
+
+    def __init__(self, name, archive, meta):
+        self.name = name
+        self.archive = archive
+        self.path = op.join(archive, name)
+        self.meta = meta
+        self._params = meta['params']
+
+    @property
+    def files(self):
+        for rel in self.meta['files']:
+            yield '/'.join((self.name, 'files', rel)), rel
+
+    @property
+    def configuration(self):
+        return get_archive(self.archive).read(
+            '/'.join((self.name, CFGFILE))).decode('utf-8')
+
+    def configure(self, parser):
+        parser.parse(self.configuration, update=False)
+
+    def kind(self, source):
+        """ Get kind of the file classified on packing.
+
+        Templates without markup which need newlines changes are rendered
+        from their precompiled modules.
+
+        """
+        if not source.endswith(self.tpl_ext):
+            return STATIC
+        rel = source[len(self.name) + len('/files/'):]
+        kind = self.meta.get('kinds', {}).get(rel, TEMPLATE)
+        return TEMPLATE if kind == TEXT else kind
+
+    def mode(self, source):
+        """ Get permissions of the archive's file or None. """
+        info = get_archive(self.archive).getinfo(source)
+        return (info.external_attr >> 16) & 0o7777 or None
+
+    def paste_file(self, source, target, strategy='copy', fs=None):
+        """ Stream file from the archive. """
+        archive = get_archive(self.archive)
+        with archive.open(source) as src, (fs or self).open_file(
+                target, self.mode(source)) as dst:
+            shutil.copyfileobj(src, dst)
+        logging.debug('File copied: {0}'.format(target))
+
+
+def load(filename):
+    """ Read bundle's index.
+
+    :returns: A tuple (roots, {name: template})
+
+    """
+    filename = op.abspath(filename)
+    index = json.loads(get_archive(filename).read(INDEX).decode('utf-8'))
+    templates = dict(
+        (meta['name'], BundleTemplate(meta['name'], filename, meta))
+        for meta in index['templates'])
+    return index['roots'], templates
+
+
+def pack(starter, filename):
+    """ Pack starter's templates with their includes to the archive.
+
+    :returns: A list of packed templates
+
+    """
+    from jinja2 import Environment, FileSystemLoader
+    from jinja2.loaders import ModuleLoader
+    from .cache import get_source_index
+
+    templates = starter.prepare_templates()
+    index = dict(roots=[], templates=[])
+
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for t in templates:
+            if t.name in starter.params.TEMPLATES:
+                index['roots'].append(t.name)
+
+            archive.write(t.configuration, '/'.join((t.name, CFGFILE)))
+            env = Environment(loader=FileSystemLoader(t.path))
+            files, kinds = [], {}
+            for source, rel in t.files:
+                rel = rel.replace(os.sep, '/')
+                files.append(rel)
+                archive.write(source, '/'.join((t.name, 'files', rel)))
+                if not rel.endswith(t.tpl_ext):
+                    continue
+
+                kinds[rel] = get_source_index().kind(source)
+                if kinds[rel] in (STATIC, BINARY):
+                    continue
+
+                body, fname, _ = env.loader.get_source(env, rel)
+                archive.writestr('/'.join((
+                    t.name, 'jinja', ModuleLoader.get_module_filename(rel))),
+                    env.compile(body, rel, fname, True, True))
+
+            index['templates'].append(dict(
+                name=t.name, params=t.params, files=files, kinds=kinds))
+            logging.info('Template packed: {0}'.format(t.name))
+
+        archive.writestr(INDEX, json.dumps(index))
+
+    return templates
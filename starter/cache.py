@@ -0,0 +1,411 @@
+""" Persistent caches. """
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from os import path as op
+
+from jinja2 import FileSystemBytecodeCache
+
+from . import CACHEDIR, __version__, profile
+from .fs import make_directory, persistent, write_json
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+
+    """ Store compiled Jinja templates on disk.
+
+    Buckets are keyed by template's path and checked by source's checksum.
+    Files are written atomically (the directory is created on the first
+    write), so several processes can share the cache.
+    The cache is pruned (least recently used first) down to `max_size`
+    bytes on the first write and then every `prune_every` writes.
+
+    """
+
+    prune_every = 64
+
+    def __init__(self, directory, max_size=50 * 1024 * 1024):
+        super(BytecodeCache, self).__init__(directory, '%s.jinja')
+        self.max_size = max_size
+        self.dumps = 0
+
+    def load_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        try:
+            with open(filename, 'rb') as f:
+                bucket.load_bytecode(f)
+            os.utime(filename, None)
+        except (IOError, OSError, EOFError, ValueError):
+            bucket.reset()
+
+        profile.count(
+            'bytecode.hit' if bucket.code is not None else 'bytecode.miss')
+
+    def dump_bytecode(self, bucket):
+        if not persistent():
+            return
+
+        filename = self._get_cache_filename(bucket)
+        tmp = None
+        try:
+            make_directory(self.directory)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            getattr(os, 'replace', os.rename)(tmp, filename)
+        except (IOError, OSError) as e:
+            logging.debug('Bytecode cache is not saved: {0}'.format(e))
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+        if not self.dumps % self.prune_every:
+            self.prune()
+        self.dumps += 1
+
+    def prune(self):
+        """ Remove least recently used files to fit the cache in max size. """
+        files = []
+        if not op.isdir(self.directory):
+            return
+
+        for name in os.listdir(self.directory):
+            path = op.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+
+        size = sum(f[1] for f in files)
+        for _, fsize, path in sorted(files):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= fsize
+
+
+class SourceIndex(object):
+
+    """ Keep hashes of templates sources and variables they use.
+
+    Entries `{path: [size, mtime, hash, names, refs, kind]}` are validated
+    by files stat. Names are undeclared variables of Jinja templates, refs
+    are templates which they include, import or extend (None for dynamic
+    references), kind is a kind of the content (see
+    :func:`starter.core.classify`). The index is shared by threads.
+
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.changed = False
+        self.lock = threading.Lock()
+        self.saving = threading.Lock()
+        self._sources = None
+
+    @property
+    def sources(self):
+        if self._sources is None:
+            sources = {}
+            try:
+                with open(self.filename) as f:
+                    sources = json.load(f)
+            except (IOError, OSError, TypeError, ValueError):
+                pass
+            self._sources = sources
+        return self._sources
+
+    def source(self, path, env=None):
+        """ Get source's hash, used variables and referenced templates.
+
+        Set `env` for Jinja templates.
+
+        :returns: A tuple (hash, names, refs)
+
+        """
+        return tuple(self.entry(path, env)[2:5])
+
+    def kind(self, path):
+        """ Get kind of the file's content. """
+        return self.entry(path)[5]
+
+    def entry(self, path, env=None):
+        """ Get the source's entry (files are read out of the lock). """
+        from .core import classify
+
+        path = op.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            info = self.sources.get(path)
+        if info and len(info) == 6 and info[:2] == [
+                st.st_size, st.st_mtime] and (
+                env is None or info[4] is not None):
+            return info
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        names = refs = []
+        if env is not None:
+            from jinja2 import meta
+
+            ast = env.parse(data.decode('utf-8'))
+            names = sorted(meta.find_undeclared_variables(ast))
+            refs = list(meta.find_referenced_templates(ast))
+
+        info = [
+            st.st_size, st.st_mtime, hashlib.sha1(data).hexdigest(), names,
+            refs if env is not None else None, classify(data)]
+        with self.lock:
+            self.sources[path] = info
+            self.changed = True
+        return info
+
+    def save(self):
+        """ Write the index atomically.
+
+        Writes are serialized, so the latest snapshot is written last.
+
+        """
+        with self.saving:
+            with self.lock:
+                if not (self.filename and self.changed and persistent()):
+                    return
+                sources, self.changed = dict(self.sources), False
+
+            try:
+                write_json(self.filename, sources)
+            except (IOError, OSError) as e:
+                logging.debug('Sources index is not saved: {0}'.format(e))
+                with self.lock:
+                    self.changed = True
+
+
+# Context items which change between pastes, they are keyed only when
+# templates use them
+VOLATILE = '_DATETIME', '_TRGDIR', '_CURDIR'
+
+
+class OutputCache(object):
+
+    """ Keep pasted trees by hashes of their inputs.
+
+    The key is a hash of resolved templates files (contents, cached by
+    files stat, and permissions) and the paste context. Volatile items (see
+    :data:`VOLATILE`) are keyed only when templates use them.
+
+    Entries are directories with pasted files and `<key>.json` files with
+    their lists (for every template). Entries are published atomically and pruned (least
+    recently used first) down to `max_size` bytes.
+
+    """
+
+    prune_every = 16
+
+    def __init__(self, directory, max_size=200 * 1024 * 1024):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self.directory = directory
+        self.max_size = max_size
+        self.stores = 0
+
+    def key(self, templates, context):
+        """ Get the key for templates pasted with the context.
+
+        :returns: A hash or None when templates can't be cached
+
+        """
+        from .core import TEMPLATE, get_names
+
+        sources = get_source_index()
+        digest, used = hashlib.sha1(__version__.encode('ascii')), set()
+        for t in templates:
+            if not op.isdir(t.path):
+                return None
+
+            digest.update(t.name.encode('utf-8'))
+            for source, rel, expression in t.paths:
+                source_hash, names, refs = sources.source(
+                    source, t.env if t.kind(source) == TEMPLATE else None)
+                digest.update(rel.encode('utf-8'))
+                digest.update(source_hash.encode('ascii'))
+                digest.update('{0:o}'.format(t.mode(source)).encode('ascii'))
+                used.update(context if refs else names)
+                if expression is not None:
+                    used.update(get_names(rel))
+
+        sources.save()
+        digest.update(json.dumps(sorted(
+            (name, value) for name, value in context.items()
+            if name not in VOLATILE or name in used), default=str).encode(
+                'utf-8'))
+        return digest.hexdigest()
+
+    def materialize(self, key, target, strategy='copy'):
+        """ Materialize the cached tree to target.
+
+        Links are not used (they would change cached files or dangle after
+        pruning), files are copied with other strategies.
+
+        :returns: Lists of pasted files for every template or None when the
+            key isn't cached
+
+        """
+        from .core import FS
+        from .fs import materialize
+
+        if strategy in ('hardlink', 'symlink'):
+            strategy = 'copy'
+
+        entry = op.join(self.directory, key)
+        try:
+            with open(entry + '.json') as f:
+                files = json.load(f)['files']
+            os.utime(entry + '.json', None)
+
+            dirs = set()
+            for rel in (rel for rels in files for rel in rels):
+                path = op.join(target, rel)
+                if op.dirname(path) not in dirs:
+                    FS.make_directory(op.dirname(path))
+                    dirs.add(op.dirname(path))
+                materialize(op.join(entry, rel), path, strategy)
+
+        except (IOError, OSError, ValueError, KeyError) as e:
+            logging.debug('Cached tree is not used: {0}'.format(e))
+            profile.count('outputs.miss')
+            return None
+
+        profile.count('outputs.hit')
+        return [[op.join(target, rel) for rel in rels] for rels in files]
+
+    def store(self, key, target, files):
+        """ Save pasted files to the cache.
+
+        :param files: Lists of pasted files for every template
+
+        """
+        from .core import FS
+        from .fs import copy
+
+        entry = op.join(self.directory, key)
+        if op.exists(entry + '.json'):
+            return
+
+        tmp = tempfile.mkdtemp(dir=self.directory, suffix='.tmp')
+        try:
+            rels, size = set(), 0
+            files = [[op.relpath(path, target) for path in ff] for ff in files]
+            for rel in (rel for ff in files for rel in ff):
+                if rel in rels:
+                    continue
+                rels.add(rel)
+                FS.make_directory(op.dirname(op.join(tmp, rel)))
+                copy(op.join(target, rel), op.join(tmp, rel))
+                size += op.getsize(op.join(tmp, rel))
+
+            # Other process could store the same tree
+            if op.exists(entry):
+                return
+            os.rename(tmp, entry)
+            tmp = None
+
+            write_json(entry + '.json', dict(files=files, size=size))
+
+        except (IOError, OSError) as e:
+            logging.debug('Pasted tree is not cached: {0}'.format(e))
+
+        finally:
+            if tmp:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        if not self.stores % self.prune_every:
+            self.prune()
+        self.stores += 1
+
+    def prune(self, expire=3600):
+        """ Remove least recently used trees to fit the cache in max size.
+
+        Incomplete entries are removed when they are older than `expire`
+        seconds.
+
+        """
+        entries, names = [], os.listdir(self.directory)
+        for name in names:
+            path = op.join(self.directory, name)
+            try:
+                if name.endswith('.json'):
+                    with open(path) as f:
+                        size = json.load(f)['size']
+                    entries.append((op.getmtime(path), size, path[:-5]))
+
+                elif op.isdir(path) and name + '.json' not in names and (
+                        time.time() - op.getmtime(path) > expire):
+                    shutil.rmtree(path, ignore_errors=True)
+
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+
+        size = sum(e[1] for e in entries)
+        for _, esize, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path + '.json')
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            size -= esize
+
+
+CACHES = {}
+
+
+def get_bytecode_cache():
+    """ Get shared bytecode cache or None when the cache is disabled. """
+    if 'bytecode' not in CACHES:
+        CACHES['bytecode'] = None
+        if CACHEDIR:
+            try:
+                CACHES['bytecode'] = BytecodeCache(
+                    op.join(CACHEDIR, 'bytecode'))
+            except OSError as e:
+                logging.debug('Bytecode cache is disabled: {0}'.format(e))
+    return CACHES['bytecode']
+
+
+def get_output_cache():
+    """ Get shared output cache or None when the cache is disabled. """
+    if 'outputs' not in CACHES:
+        CACHES['outputs'] = None
+        if CACHEDIR:
+            try:
+                CACHES['outputs'] = OutputCache(op.join(CACHEDIR, 'outputs'))
+            except OSError as e:
+                logging.debug('Output cache is disabled: {0}'.format(e))
+    return CACHES['outputs']
+
+
+def get_source_index():
+    """ Get shared index of templates sources. """
+    if 'sources' not in CACHES:
+        CACHES.setdefault('sources', SourceIndex(
+            CACHEDIR and op.join(CACHEDIR, 'files.json')))
+    return CACHES['sources']
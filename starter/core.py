@@ -1,30 +1,134 @@
 import errno
 import re
-from datetime import datetime
-from os import path as op, walk, environ, makedirs, listdir
+from io import BytesIO
+from os import path as op, walk, environ, makedirs, chmod, stat
 
 import logging
-import shutil
-from functools import partial
+from collections import OrderedDict
 from inirama import InterpolationNamespace, InterpolationSection
-from jinja2 import Environment, FileSystemLoader, Template as JinjaTemplate
-from oset import oset
 
-from . import CFGFILE, CURDIR, BUILTIN_TMPLDIR, HOME_TMPLDIR_NAME, _compat
+from . import (
+    CFGFILE, CURDIR, BUILTIN_TMPLDIR, HOME_TMPLDIR_NAME, BUNDLE_EXT, _compat,
+    profile)
+from .index import INDEX
+from .manifest import Manifest
+from .pool import Pool
+
+
+# Jinja2 and other heavy modules are imported in place, so commands which
+# don't render anything (--version, --list) start fast.
+
+ENVIRONMENTS = {}
+
+# Compiled expressions from configurations and paths names
+EXPRESSIONS = {}
+EXPRESSIONS_LIMIT = 4096
+
+# Rendered chunks are written to files by groups
+STREAM_BUFFER = 64
+
+# Kinds of templates files (see :func:`classify`)
+STATIC, TEXT, TEMPLATE, BINARY = 'static', 'text', 'template', 'binary'
+
+MARKUP_RE = re.compile(br'\{[{%#]')
+NEWLINE_RE = re.compile(br'\r\n?')
 
 
 # Application
 # ===========
 
+def get_expression(source):
+    """ Get compiled Jinja template for the expression (memoized). """
+    t = EXPRESSIONS.get(source)
+    if t is None:
+        from jinja2 import Template as JinjaTemplate
+
+        # Other threads could clear the cache, so don't read it again
+        if len(EXPRESSIONS) >= EXPRESSIONS_LIMIT:
+            EXPRESSIONS.clear()
+        t = EXPRESSIONS[source] = JinjaTemplate(source)
+    return t
+
+
+def get_names(source):
+    """ Get names of variables used by the expression. """
+    from jinja2 import meta
+
+    t = get_expression(source)
+    return meta.find_undeclared_variables(t.environment.parse(source))
+
+
+def render_expression(t, context):
+    """ Render compiled expression with the shared context (not copied).
+
+    The context should contain the template's globals.
+
+    """
+    ctx = t.new_context(context, shared=True)
+    return t.environment.concat(t.root_render_func(ctx))
+
+
+def classify(data):
+    """ Get kind of the `.j2` file by its content (bytes).
+
+    Content without Jinja markup is rendered as is, except newlines: it's
+    `static` when rendering doesn't change it and `text` otherwise.
+
+    """
+    if b'\0' in data:
+        return BINARY
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return BINARY
+    if MARKUP_RE.search(data):
+        return TEMPLATE
+    if b'\r' in data or data.endswith(b'\n'):
+        return TEXT
+    return STATIC
+
+
 class JinjaInterpolationSection(InterpolationSection):
 
-    """ Interpolate Jinja vars in ini files. """
+    """ Interpolate Jinja vars in ini files.
+
+    Raw items (the interpolation context) are collected once and reset
+    when the section is changed.
+
+    """
 
     var_re = re.compile('{{([^}]+)}}')
 
+    _raw = None
+
     def __interpolate__(self, math):
-        t = JinjaTemplate(math.group(0))
-        return t.render(**dict(self.items(raw=True)))
+        t = get_expression(math.group(0))
+        if self._raw is None:
+            self._raw = dict(t.globals)
+            self._raw.update(self.items(raw=True))
+
+        # Don't copy the context for every match
+        return render_expression(t, self._raw)
+
+    def __setitem__(self, name, value):
+        self._raw = None
+        super(JinjaInterpolationSection, self).__setitem__(name, value)
+
+    def __delitem__(self, name):
+        self._raw = None
+        super(JinjaInterpolationSection, self).__delitem__(name)
+
+    def pop(self, *args):
+        self._raw = None
+        return super(JinjaInterpolationSection, self).pop(*args)
+
+    def popitem(self, *args):
+        self._raw = None
+        return super(JinjaInterpolationSection, self).popitem(*args)
+
+    def clear(self):
+        self._raw = None
+        super(JinjaInterpolationSection, self).clear()
 
 
 class JinjaInterpolationNamespace(InterpolationNamespace):
@@ -36,7 +140,12 @@ class JinjaInterpolationNamespace(InterpolationNamespace):
 
 class FS(object):
 
-    """ File system interface. """
+    """ File system interface.
+
+    Templates are pasted to the disk by default, other backends (see
+    :class:`MemoryFS`) implement the same methods.
+
+    """
 
     @staticmethod
     def make_directory(path):
@@ -49,23 +158,214 @@ class FS(object):
             if e.errno != errno.EEXIST:
                 raise
 
-    def copy_file(self, from_path, to_path):
-        """ Copy file. """
-        if not op.exists(op.dirname(to_path)):
-            self.make_directory(op.dirname(to_path))
+    def copy_file(self, from_path, to_path, strategy='copy'):
+        """ Copy file (see :data:`starter.fs.STRATEGIES`). """
+        from .fs import materialize
 
-        shutil.copy(from_path, to_path)
+        materialize(from_path, to_path, strategy)
         logging.debug('File copied: {0}'.format(to_path))
 
+    @staticmethod
+    def open_file(path, mode=None):
+        """ Open file for writing (binary), the directory should exist.
+
+        :param mode: File's permissions
+
+        """
+        from .fs import unshare
+
+        unshare(path)
+        f = open(path, 'wb')
+        if mode is not None:
+            chmod(path, mode)
+        return f
+
+    @staticmethod
+    def getsize(path):
+        """ Get size of the file. """
+        return op.getsize(path)
+
+
+class MemoryFS(FS):
+
+    """ Keep pasted files in memory.
+
+    Files are saved to `files` dictionary {path: bytes}, permissions of
+    files (when they are known) to `modes`.
+
+    """
+
+    def __init__(self):
+        self.files = OrderedDict()
+        self.modes = {}
+        self.dirs = set()
+
+    def make_directory(self, path):
+        self.dirs.add(path)
+
+    def copy_file(self, from_path, to_path, strategy='copy'):
+        with open(from_path, 'rb') as f:
+            self.files[to_path] = f.read()
+
+    def open_file(self, path, mode=None):
+        if mode is not None:
+            self.modes[path] = mode
+        return MemoryFile(self, path)
+
+    def getsize(self, path):
+        return len(self.files[path])
+
+
+class MemoryFile(BytesIO):
+
+    """ Save content to the memory file system when closed. """
+
+    def __init__(self, fs, path):
+        BytesIO.__init__(self)
+        self.fs, self.path = fs, path
+
+    def close(self):
+        if not self.closed:
+            self.fs.files[self.path] = self.getvalue()
+        BytesIO.close(self)
+
+
+def get_environment(path):
+    """ Get Jinja environment for the template path.
+
+    Templates from bundles (`archive/name`) are loaded precompiled.
+
+    """
+    if path not in ENVIRONMENTS:
+        from jinja2 import Environment, FileSystemLoader, ModuleLoader
+        from .cache import get_bytecode_cache
+
+        if op.isfile(op.dirname(path)):
+            ENVIRONMENTS[path] = Environment(
+                loader=ModuleLoader(op.join(path, 'jinja')))
+        else:
+            ENVIRONMENTS[path] = Environment(
+                loader=FileSystemLoader(op.abspath(path)),
+                bytecode_cache=get_bytecode_cache())
+    return ENVIRONMENTS[path]
+
+
+def render_file(
+        path, rel, target, context, update=False, fs=None, mode=None):
+    """ Render template file to target.
+
+    Rendered chunks are streamed to the file, so memory usage doesn't
+    depend on the output's size. Defined on module level to be available
+    for process pools.
+
+    :param update: Don't write the target if it has the same content
+    :param fs: File system (the disk by default)
+    :param mode: Target's permissions (the source's ones)
+    :returns: False if the target is not changed
+
+    """
+    from .fs import unshare
+
+    with profile.phase('compile'):
+        t = get_environment(path).get_template(rel)
+
+    stream = t.stream(**context)
+    stream.enable_buffering(STREAM_BUFFER)
+
+    if fs is not None:
+        with fs.open_file(target, mode) as f:
+            stream.dump(f, 'utf-8')
+        return
+
+    if not (update and op.isfile(target)):
+        unshare(target)
+        with open(target, 'w') as f:
+            stream.dump(f)
+        if mode is not None:
+            chmod(target, mode)
+        logging.debug('Template rendered: `{0}`'.format(target))
+        return
+
+    import filecmp
+    import os
+    import shutil
+    import tempfile
+
+    fd, tmp = tempfile.mkstemp(dir=op.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            stream.dump(f)
+
+        if filecmp.cmp(tmp, target, shallow=False):
+            if mode is not None:
+                chmod(target, mode)
+            logging.debug('Template is not changed: `{0}`'.format(target))
+            return False
+
+        if mode is not None:
+            chmod(tmp, mode)
+        else:
+            shutil.copymode(target, tmp)
+        getattr(os, 'replace', os.rename)(tmp, target)
+        tmp = None
+        logging.debug('Template rendered: `{0}`'.format(target))
+
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+
+def write_text(source, target, update=False, fs=None):
+    """ Write `.j2` file without markup as Jinja renders it.
+
+    Newlines are normalized and the trailing newline is removed, nothing
+    is compiled. The target gets the source's permissions.
+
+    :param update: Don't write the target if it has the same content
+    :param fs: File system (the disk by default)
+    :returns: False if the target is not changed
+
+    """
+    from .fs import unshare
+
+    mode = stat(source).st_mode & 0o7777
+    with open(source, 'rb') as f:
+        data = NEWLINE_RE.sub(b'\n', f.read())
+    if data.endswith(b'\n'):
+        data = data[:-1]
+
+    if fs is not None:
+        with fs.open_file(target, mode) as f:
+            f.write(data)
+        return
+
+    if update and op.isfile(target):
+        with open(target, 'rb') as f:
+            if f.read() == data:
+                chmod(target, mode)
+                logging.debug('Template is not changed: `{0}`'.format(target))
+                return False
+
+    unshare(target)
+    with open(target, 'wb') as f:
+        f.write(data)
+    chmod(target, mode)
+    logging.debug('Template written: `{0}`'.format(target))
+
 
 class Template(FS):
 
     """ Implement template object. """
 
     tpl_ext = '.j2'
-    var_re = re.compile(r'\{\{([^\}]+)\}\}')
+    var_re = re.compile(r'\{[{%#]')
+
+    # Pasted files are tracked by manifests (see :mod:`starter.manifest`)
+    updatable = True
 
-    def __init__(self, name, source='', dirs=None):
+    _paths = None
+
+    def __init__(self, name, source='', dirs=None, params=None):
         self.name = name
         self.path = source
         dirs = list(dirs or [])
@@ -75,7 +375,7 @@ class Template(FS):
         except (IndexError, AttributeError):
             raise ValueError("Template `%s` not found." % name)
 
-        self.env = Environment(loader=FileSystemLoader(self.path))
+        self._params = params
 
     def __eq__(self, other):
         if isinstance(other, Template):
@@ -88,6 +388,12 @@ class Template(FS):
     def __repr__(self):
         return "<Template: {0}>".format(self.path)
 
+    def __getstate__(self):
+        # Compiled paths can't be pickled, processes compile them again
+        state = dict(self.__dict__)
+        state.pop('_paths', None)
+        return state
+
     @property
     def files(self):
         for root, _, files in walk(self.path):
@@ -96,54 +402,168 @@ class Template(FS):
                 target = op.relpath(source, self.path)
                 yield source, target
 
+    @property
+    def paths(self):
+        """ Get self files with compiled path names (cached).
+
+        :returns: A list of (source, rel, expression), expression is a
+            compiled Jinja template for paths with placeholders or None
+
+        """
+        if self._paths is None:
+            self._paths = [
+                (source, rel, get_expression(rel)
+                 if self.var_re.search(rel) else None)
+                for source, rel in self.files]
+        return self._paths
+
+    @property
+    def env(self):
+        return get_environment(self.path)
+
     @property
     def configuration(self):
         """ Return path to template configuration. """
         return op.join(self.path, CFGFILE)
 
+    def kind(self, source):
+        """ Get kind of the file (see :func:`classify`).
+
+        Templates are classified once by their content, kinds are kept in
+        the sources index.
+
+        """
+        from .cache import get_source_index
+
+        if not source.endswith(self.tpl_ext):
+            return STATIC
+        return get_source_index().kind(source)
+
+    def mode(self, source):
+        """ Get permissions of the source file. """
+        return stat(source).st_mode & 0o7777
+
+    def compile(self):
+        """ Load (compile) all self templates to the environment. """
+        for source, rel in self.files:
+            if self.kind(source) == TEMPLATE:
+                self.env.get_template(rel)
+
+    def configure(self, parser):
+        """ Read self configuration to the parser (don't redefine items). """
+        parser.read(self.configuration, update=False)
+
+    @property
+    def includes(self):
+        """ Get names of included templates. """
+        from oset import oset
+
+        include = str(self.params.get('include', '')).replace(' ', '')
+        return list(filter(None, oset(include.split(','))))
+
     @property
     def params(self):
         """ Read self params from configuration. """
-        parser = JinjaInterpolationNamespace()
-        parser.read(self.configuration)
-        return dict(parser['params'] or {})
+        if self._params is None:
+            parser = JinjaInterpolationNamespace()
+            parser.read(self.configuration)
+            self._params = dict(parser['params'] or {})
+        return self._params
+
+    @property
+    def names(self):
+        """ Get names of context items used by self files and paths names.
+
+        :returns: A set of names or None when any item could be used
+
+        """
+        from .cache import get_source_index
+
+        if not op.isdir(self.path):
+            return None
+
+        sources, names, seen = get_source_index(), set(), set()
+        stack = []
+        for source, rel, expression in self.paths:
+            if expression is not None:
+                names.update(get_names(rel))
+            if self.kind(source) == TEMPLATE:
+                stack.append(source)
+
+        # Included templates are rendered with the same context
+        while stack:
+            source = stack.pop()
+            if source in seen or not op.isfile(source):
+                continue
+            seen.add(source)
+            _, used, refs = sources.source(source, self.env)
+            if None in refs:
+                return None
+            names.update(used)
+            stack.extend(op.join(self.path, ref) for ref in refs)
+
+        sources.save()
+        return names
 
     def paste(self, **context):
-        logging.info('Paste template: {0}'.format(self.name))
-        for source, rel in self.files:
-            target = op.join(context.get('_TRGDIR', CURDIR), rel)
+        """ Paste self files to `_TRGDIR`. """
+        return self.paste_files(context)
+
+    def paste_file(self, source, target, strategy='copy', fs=None):
+        """ Copy static file to the file system (the disk by default). """
+        (fs or self).copy_file(source, target, strategy)
+
+    def targets(self, context):
+        """ Get targets of self files for the context.
+
+        :returns: A list of (source, rel, target)
+
+        """
+        targets, names = [], None
+        trgdir = context.get('_TRGDIR', CURDIR)
+        for source, rel, expression in self.paths:
+            target = op.join(trgdir, rel)
 
             # Interpolate vars in file path
-            target = self.var_re.sub(
-                lambda m: context.get(m.group(1), ''), target)
+            if expression is not None:
+                if names is None:
+                    names = dict(expression.globals)
+                    names.update(context)
+                target = op.join(trgdir, render_expression(expression, names))
 
-            # Copy files
-            if not rel.endswith(self.tpl_ext):
-                self.copy_file(source, target)
-                continue
+            if rel.endswith(self.tpl_ext):
+                target = target[:-len(self.tpl_ext)]
+
+            targets.append((source, rel, target))
+        return targets
 
-            # Render and copy templates
-            target = target[:-len(self.tpl_ext)]
-            self.make_directory(op.dirname(target))
-            with open(target, 'w') as f:
-                t = self.env.get_template(rel)
-                f.write(t.render(**context))
-                logging.debug('Template rendered: `{0}`'.format(f.name))
+    def paste_files(
+            self, context, pool=None, strategy='copy', manifest=None,
+            fs=None, only=None):
+        """ Render and copy self files using the given pool.
+
+        Static files are materialized with the strategy, templates without
+        markup aren't rendered and binary content isn't decoded (see
+        :meth:`kind`). See :meth:`starter.plan.Plan.apply` for the manifest
+        and file system.
+
+        :param only: Paste only the given sources
+        :returns: A list of pasted files
+
+        """
+        from .plan import Plan
+
+        plan = Plan(context.get('_TRGDIR', CURDIR))
+        plan.add(self, context, only)
+        return plan.apply(
+            context, pool, strategy, manifest, fs).get(self, [])
 
     @classmethod
     def scan(cls, path):
         """ Scan directory for templates. """
-        result = []
-        try:
-            for _p in listdir(path):
-                try:
-                    result.append(Template(_p, op.join(path, _p)))
-                except ValueError:
-                    continue
-        except OSError:
-            pass
-
-        return result
+        return [
+            cls(name, meta['path'], params=meta['params'])
+            for name, meta in INDEX.scan(path).items()]
 
 
 class Starter(FS):
@@ -160,81 +580,334 @@ class Starter(FS):
     default_tmpldirs = [
         op.join(environ.get('HOME', '~'), HOME_TMPLDIR_NAME), BUILTIN_TMPLDIR]
 
-    def __init__(self, params, *dirs):
-        """ Save params and create INI parser. """
+    def __init__(self, params, *dirs, **options):
+        """ Save params and create INI parser.
+
+        Keyword options override the same named params (`workers`,
+        `processes`, `materialize`, `update`, `cache_outputs`, `source`,
+        `dry_run`, `no_hooks`, `serve_*`). Templates from the source (see
+        :mod:`starter.sources`) have the highest priority.
+
+        :raises ValueError: when the source can't be loaded
+
+        """
         self.params = params
+        self.options = options
         self.dirs = list(dirs) + self.default_tmpldirs
 
-        # Initialize parser
+        source = self.option('source')
+        if source:
+            from .sources import resolve
+
+            self.dirs.append(resolve(source))
+        self.bundles = {}
+        self._parser = self._lookup = None
+
+    @property
+    def parser(self):
+        """ Create INI parser on first access. """
+        if self._parser is not None:
+            return self._parser
+
+        # Other items are computed by providers (see :meth:`provide`)
         context = {
             '_TRGDIR': self.params.TARGET,
             '_CURDIR': CURDIR,
-            '_USER': environ.get("USER"),
-            '_DATETIME': datetime.now(),
         }
-        context.update(params.context)
-        self.parser = JinjaInterpolationNamespace(**context)
-        self.parser.read(*self.default_configs)
-        self.parser.read(self.params.config)
-
-    def copy(self):
-        """ Prepare and paste self templates. """
-        templates = self.prepare_templates()
+        context.update(self.params.context)
+        with profile.phase('config'):
+            self._parser = JinjaInterpolationNamespace(**context)
+            for filename in self.default_configs + [self.params.config]:
+                self.read_config(self._parser, filename)
+        return self._parser
+
+    @staticmethod
+    def read_config(parser, filename, update=True):
+        """ Read the configuration file to the parser.
+
+        :param update: Redefine items which are defined already
+
+        """
+        parser.read(filename, update=update)
+
+    def configure(self, template):
+        """ Read template's configuration to self parser. """
+        template.configure(self.parser)
+
+    def copy(self, templates=None, fs=None):
+        """ Prepare and paste self templates.
+
+        :param templates: Already prepared templates
+        :param fs: File system (the disk by default)
+        :returns: Lists of pasted files for every template (nothing is
+            pasted with `dry_run` option, the plan is shown)
+
+        """
+        templates = templates or self.prepare_templates()
+        context = self.prepare_context(templates)
+
+        if self.option('dry_run'):
+            logging.warning(self.plan(templates, context))
+            return []
+
+        logging.warning("Paste templates: {0}".format(context['templates']))
+        (fs or self).make_directory(self.params.TARGET)
+        files = self.paste(templates, context, fs)
+
+        if fs is None:
+            self.run_hooks(context)
+
+        return files
+
+    def prepare_context(self, templates):
+        """ Compute (and ask in the interactive mode) the paste context.
+
+        Only items used by the templates are interpolated.
+
+        :returns: A dictionary
+
+        """
+        names = self.get_names(templates)
+        self.provide(names)
+
         if self.params.interactive:
-            keys = list(self.parser.default)
-            for key in keys:
-                if key.startswith('_'):
-                    continue
-                prompt = "{0} (default is \"{1}\")? ".format(
-                    key, self.parser.default[key])
-
-                if _compat.PY2:
-                    value = raw_input(prompt.encode('utf-8')).decode('utf-8')
-                else:
-                    value = input(prompt.encode('utf-8'))
-
-                value = value.strip()
-                if value:
-                    self.parser.default[key] = value
-
-        self.parser.default['templates'] = tt = ','.join(
-            t.name for t in templates)
-        logging.warning("Paste templates: {0}".format(tt))
-        self.make_directory(self.params.TARGET)
-
-        logging.debug("\nDefault context:\n----------------")
-        logging.debug(
-            ''.join('{0:<15} {1}\n'.format(*v)
-                    for v in self.parser.default.items())
-        )
-        return [t.paste(
-            **dict(self.parser.default.items())) for t in templates]
+            self.ask(names)
+
+        self.parser.default['templates'] = ','.join(t.name for t in templates)
+
+        with profile.phase('interpolate'):
+            context = dict(
+                (key, self.parser.default[key]) for key in self.parser.default
+                if names is None or key in names or key in (
+                    '_TRGDIR', 'templates'))
+
+        logging.debug("\nContext:\n--------")
+        logging.debug(''.join(
+            '{0:<15} {1}\n'.format(*v) for v in sorted(context.items())))
+        return context
+
+    def ask(self, names=None):
+        """ Ask values of context items (except private ones).
+
+        :param names: Ask only items with the names (all by default)
+
+        """
+        for key in list(self.parser.default):
+            if key.startswith('_') or names is not None and (
+                    key not in names):
+                continue
+            prompt = "{0} (default is \"{1}\")? ".format(
+                key, self.parser.default[key])
+
+            if _compat.PY2:
+                value = raw_input(prompt.encode('utf-8')).decode('utf-8')
+            else:
+                value = input(prompt.encode('utf-8'))
+
+            value = value.strip()
+            if value:
+                self.parser.default[key] = value
+
+    def paste(self, templates, context, fs=None):
+        """ Plan and paste the templates with the context.
+
+        Pasted trees are cached for the disk (not in update mode, see
+        `cache_outputs` option).
+
+        :returns: Lists of pasted files for every template
+
+        """
+        manifest = fs is None and self.option('update') and Manifest(
+            self.params.TARGET)
+
+        key = files = None
+        if fs is None and not manifest:
+            key, files = self.load_outputs(templates, context)
+            if files is not None:
+                return files
+
+        with profile.phase('plan'):
+            plan = self.plan(templates, context)
+
+        with Pool(self.option('workers', 1),
+                  self.option('processes', False)) as pool:
+            pasted = plan.apply(
+                context, pool, self.option('materialize'), manifest, fs)
+        files = [pasted.get(t, []) for t in templates]
+
+        if manifest:
+            manifest.save()
+
+        if key:
+            from .cache import get_output_cache
+
+            get_output_cache().store(key, self.params.TARGET, files)
+
+        return files
+
+    def load_outputs(self, templates, context):
+        """ Materialize cached outputs of the templates to self target.
+
+        :returns: A tuple (key, lists of pasted files or None when the key
+            isn't cached), the key is None when outputs aren't cached
+
+        """
+        from .cache import get_output_cache
+
+        cache = self.option('cache_outputs') and get_output_cache()
+        key = cache and cache.key(templates, context)
+        if not key:
+            return None, None
+
+        return key, cache.materialize(
+            key, self.params.TARGET, self.option('materialize'))
+
+    def run_hooks(self, context):
+        """ Run post-paste hooks in the target (see :mod:`starter.hooks`).
+
+        Hooks are not run with `no_hooks` option.
+
+        :raises starter.hooks.HookError: when some of hooks are failed
+
+        """
+        from .hooks import read_hooks, run_hooks
+
+        if self.option('no_hooks'):
+            return
+
+        hooks = read_hooks(self.parser, context)
+        if hooks:
+            with profile.phase('hooks'):
+                run_hooks(hooks, self.params.TARGET)
+
+    def plan(self, templates, context):
+        """ Plan paste of the templates (see :mod:`starter.plan`).
+
+        :returns: A :class:`starter.plan.Plan`
+
+        """
+        from .plan import Plan
+
+        plan = Plan(context.get('_TRGDIR', self.params.TARGET))
+        for t in templates:
+            plan.add(t, context)
+        return plan
+
+    def get_names(self, templates):
+        """ Get names of context items used by the templates.
+
+        Names used by values of the used items are included.
+
+        :returns: A set of names or None when any item could be used
+
+        """
+        from .hooks import read_hooks
+
+        names = set()
+        for t in templates:
+            used = t.names
+            if used is None:
+                return None
+            names.update(used)
+
+        # Hooks commands are rendered with the same context
+        for hook in read_hooks(self.parser).values():
+            names.update(get_names(hook.command))
+
+        raw = dict(self.parser.default.items(raw=True))
+        stack = list(names)
+        while stack:
+            value = raw.get(stack.pop())
+            if not isinstance(value, _compat.string_types) or (
+                    '{{' not in value):
+                continue
+            for name in get_names(value):
+                if name not in names:
+                    names.add(name)
+                    stack.append(name)
+
+        return names
+
+    def provide(self, names=None):
+        """ Compute context items by providers (see :mod:`starter.providers`).
+
+        Items which are defined already are not computed.
+
+        :param names: Compute only items with the names (all by default)
+
+        """
+        from .providers import PROVIDERS
+
+        for name, provider in PROVIDERS.items():
+            if names is not None and name not in names or (
+                    name in self.parser.default):
+                continue
+            self.parser.default[name] = provider(self)
+
+    def get_context(self, **context):
+        """ Get paste context with the given items redefined.
+
+        Interpolated values are computed again with the new items.
+
+        """
+        parser = JinjaInterpolationNamespace(
+            **dict(self.parser.default.items(raw=True)))
+        for key, value in context.items():
+            parser.default[key] = value
+        return dict(parser.default.items())
+
+    def option(self, name, default=None):
+        """ Get option from self options or params. """
+        return self.options.get(name, getattr(self.params, name, default))
 
     def prepare_templates(self):
-        to_template = partial(map, lambda t: Template(t, dirs=self.dirs))
-        templates = list(to_template(self.params.TEMPLATES))
-        cache = set(templates)
+        """ Resolve templates with includes and read their configurations.
+
+        :returns: A list of templates (includes first)
+
+        """
+        with profile.phase('resolve'):
+            graph = self.resolve()
 
-        def open_templates(*templates):
+        with profile.phase('configure'):
+            for t in graph.templates.values():
+                self.configure(t)
+            self.parser['params'].pop('include', None)
 
-            for t in templates:
-                self.parser.read(t.configuration, update=False)
-                cache.add(t)
+        return graph.order
 
-                try:
-                    include = self.parser['params'].pop('include')
-                    include = filter(None, oset(
-                        include.replace(' ', '').split(',')))
-                    requirements = filter(  # noqa
-                        lambda t: t not in cache, to_template(include))
-                    for tt in open_templates(*requirements):
-                        yield tt
-                except KeyError:
-                    pass
+    def resolve(self):
+        """ Resolve self templates includes.
 
-                yield t
+        :returns: A :class:`starter.graph.Graph`
 
-        return list(open_templates(*templates))
+        """
+        from .graph import Graph
+
+        names = []
+        for name in self.params.TEMPLATES:
+            if name.endswith(BUNDLE_EXT) and op.isfile(name):
+                names.extend(self.load_bundle(name))
+            else:
+                names.append(name)
+
+        graph = Graph(self.get_template)
+        graph.resolve(*names)
+        return graph
+
+    def load_bundle(self, filename):
+        """ Load templates from the bundle.
+
+        Bundle's templates are preferred when includes are resolved.
+
+        :returns: A list of bundle's root templates names
+
+        """
+        from .bundle import load
+
+        roots, templates = load(filename)
+        self.bundles.update(templates)
+        return roots
 
     def iterate_templates(self):
         """ Iterate self starter templates.
@@ -242,7 +915,76 @@ class Starter(FS):
         :returns: A templates generator
 
         """
-        return [t for dd in self.dirs for t in Template.scan(dd)]
+        return [
+            Template(name, meta['path'], params=meta['params'])
+            for dd in self.dirs for name, meta in INDEX.scan(dd).items()]
+
+    def get_template(self, name):
+        """ Find template by name in self dirs.
+
+        The last directory has the highest priority. Paths (names with
+        separators) are probed in the directories.
+
+        :raises ValueError: when template is not found
+
+        """
+        if name in self.bundles:
+            return self.bundles[name]
+
+        meta = self.lookup.get(name)
+        if meta:
+            return Template(name, meta['path'], params=meta['params'])
+
+        if op.sep in name or op.altsep and op.altsep in name:
+            return Template(name, dirs=self.dirs)
+
+        raise ValueError("Template `%s` not found." % name)
+
+    @property
+    def lookup(self):
+        """ Get table of templates {name: meta} for self dirs.
+
+        The table is built once (while self dirs are not changed), the last
+        directory has the highest priority.
+
+        """
+        dirs = tuple(self.dirs)
+        if self._lookup is None or self._lookup[0] != dirs:
+            table = {}
+            for dd in dirs:
+                table.update(INDEX.scan(dd))
+            self._lookup = dirs, table
+        return self._lookup[1]
 
     def __repr__(self):
         return "<Starter '%s'>" % CURDIR
+
+
+def render(templates, context=None, dirs=()):
+    """ Render templates (with their includes) to memory.
+
+    Nothing is written to the disk: ::
+
+        files = render(['py-package'], dict(PROJECT_NAME='demo'))
+        files['setup.py']
+
+    :param templates: Names of templates
+    :param context: Context items
+    :param dirs: Templates directories (besides the default ones)
+    :returns: A dictionary {relative path: bytes}
+
+    """
+    from argparse import Namespace
+    from .fs import in_memory
+
+    params = Namespace(
+        TEMPLATES=list(templates), TARGET='', context=[], config=None,
+        interactive=False)
+    starter = Starter(params, *dirs)
+    starter.parser.default.update(context or {})
+
+    # Caches are kept in memory too
+    fs = MemoryFS()
+    with in_memory():
+        starter.copy(fs=fs)
+    return fs.files
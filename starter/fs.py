@@ -0,0 +1,163 @@
+""" Materialize static files and write files atomically.
+
+Caches aren't written to the disk in :func:`in_memory` blocks (rendering to
+memory doesn't touch the disk).
+
+"""
+
+import errno
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from os import path as op
+
+
+# Linux ioctl to share file's extents (btrfs, xfs)
+FICLONE = 0x40049409
+
+# Threads which keep caches in memory (see :func:`in_memory`)
+LOCAL = threading.local()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+@contextmanager
+def in_memory():
+    """ Don't write caches to the disk in this thread while in the block. """
+    LOCAL.depth = getattr(LOCAL, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        LOCAL.depth -= 1
+
+
+def persistent():
+    """ Check that caches can be written to the disk by this thread. """
+    return not getattr(LOCAL, 'depth', 0)
+
+
+def make_directory(path):
+    """ Create the directory (with parents) if it doesn't exist. """
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def write_json(filename, data):
+    """ Write JSON file atomically (create its directory if needed).
+
+    :raises IOError, OSError: when the file can't be written
+
+    """
+    dirname = op.dirname(filename) or '.'
+    make_directory(dirname)
+
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        getattr(os, 'replace', os.rename)(tmp, filename)
+    except Exception: # noqa
+        _remove(tmp)
+        raise
+
+
+def unshare(path):
+    """ Remove the path if it is a link, so writing to it is safe.
+
+    Files could be linked to templates sources by previous pastes.
+
+    """
+    try:
+        if op.islink(path) or os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def copy(source, target):
+    """ Copy file's data and mode. """
+    unshare(target)
+    shutil.copy(source, target)
+
+
+def hardlink(source, target):
+    """ Link target to the source's inode. """
+    _remove(target)
+    os.link(source, target)
+
+
+def symlink(source, target):
+    """ Make symbolic link to the source. """
+    _remove(target)
+    os.symlink(op.abspath(source), target)
+
+
+def reflink(source, target):
+    """ Clone file's extents (copy-on-write) where filesystem supports it. """
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOTSUP, 'Reflinks are not supported.')
+
+    import fcntl
+
+    unshare(target)
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copymode(source, target)
+
+
+def kernel(source, target):
+    """ Copy file's data inside the kernel (copy_file_range or sendfile). """
+    if not hasattr(os, 'copy_file_range') and not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOTSUP, 'Kernel copy is not supported.')
+
+    unshare(target)
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        src, dst = src.fileno(), dst.fileno()
+        size, offset = os.fstat(src).st_size, 0
+        while offset < size:
+            if hasattr(os, 'copy_file_range'):
+                sent = os.copy_file_range(
+                    src, dst, size - offset, offset, offset)
+            else:
+                sent = os.sendfile(dst, src, offset, size - offset)
+            if not sent:
+                raise OSError(errno.EIO, 'Unexpected end of file.')
+            offset += sent
+    shutil.copymode(source, target)
+
+
+STRATEGIES = dict(
+    copy=copy, hardlink=hardlink, symlink=symlink, reflink=reflink,
+    kernel=kernel)
+
+
+def materialize(source, target, strategy='copy'):
+    """ Materialize source file to target with the strategy.
+
+    Falls back to plain copy when the strategy is not supported (crossed
+    devices, filesystem without reflinks and etc).
+
+    """
+    if strategy and strategy != 'copy':
+        try:
+            return STRATEGIES[strategy](source, target)
+        except (IOError, OSError) as e:
+            logging.debug('{0} failed ({1}), copy file: {2}'.format(
+                strategy, e, target))
+
+    copy(source, target)
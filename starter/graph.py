@@ -0,0 +1,76 @@
+""" Resolve templates includes. """
+
+import logging
+from collections import OrderedDict
+
+
+class Graph(object):
+
+    """ Graph of templates includes.
+
+    Every template is loaded and its includes are read once, so resolving
+    takes linear time. Cycles are reported and their back edges are
+    ignored.
+
+    :param get_template: A function which returns template by name
+
+    """
+
+    def __init__(self, get_template):
+        self.get_template = get_template
+
+        # Templates in order of discovering (depth-first preorder)
+        self.templates = OrderedDict()
+        self.includes = {}
+
+        # Templates in topological order (includes first)
+        self.order = []
+        self.cycles = []
+
+    def visit(self, name):
+        t = self.templates[name] = self.get_template(name)
+        self.includes[name] = t.includes
+        return iter(self.includes[name])
+
+    def resolve(self, *names):
+        """ Resolve templates and their includes.
+
+        :returns: A list of templates in topological order
+
+        """
+        done = set()
+        for name in names:
+            if name in self.templates:
+                continue
+
+            stack = [(name, self.visit(name))]
+            while stack:
+                name, includes = stack[-1]
+                for include in includes:
+                    if include not in self.templates:
+                        stack.append((include, self.visit(include)))
+                        break
+
+                    if include not in done:
+                        cycle = [n for n, _ in stack]
+                        cycle = cycle[cycle.index(include):] + [include]
+                        self.cycles.append(cycle)
+                        logging.warning('Include cycle: {0}'.format(
+                            ' -> '.join(cycle)))
+                else:
+                    stack.pop()
+                    done.add(name)
+                    self.order.append(self.templates[name])
+
+        return self.order
+
+    def __str__(self):
+        lines = []
+        for t in self.order:
+            lines.append('{0} ({1})'.format(t.name, t.path))
+            if self.includes[t.name]:
+                lines.append('  includes: {0}'.format(
+                    ', '.join(self.includes[t.name])))
+        for cycle in self.cycles:
+            lines.append('cycle: {0}'.format(' -> '.join(cycle)))
+        return '\n'.join(lines)
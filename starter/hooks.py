@@ -0,0 +1,239 @@
+""" Run commands after pasting.
+
+Templates declare hooks in `starter.ini` sections: ::
+
+    [hook:git]
+    command = git init -q
+
+    [hook:venv]
+    command = python -m venv .venv
+    timeout = 120
+
+    [hook:install]
+    command = .venv/bin/pip install -e .
+    requires = venv
+
+Commands are Jinja templates rendered with the paste context (values are
+shell-quoted), they are run by the shell in the target directory.
+Independent hooks run concurrently, a hook starts when the hooks it requires
+are succeeded (otherwise it's skipped). Output is captured, hooks are
+killed after `timeout` seconds.
+
+Included templates contribute their hooks, settings of including templates
+win (as for other configuration items).
+
+"""
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from . import _compat
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+SECTION_PREFIX = 'hook:'
+
+# Default timeout (seconds)
+HOOK_TIMEOUT = 300
+
+# Hooks statuses
+OK, FAILED, TIMEOUT, SKIPPED = 'ok', 'failed', 'timeout', 'skipped'
+
+ENVIRONMENTS = {}
+
+
+class HookError(Exception):
+
+    """ Some of hooks are failed. """
+
+    def __init__(self, hooks):
+        self.hooks = hooks
+        super(HookError, self).__init__("{0} hook(s) failed:\n{1}".format(
+            len(hooks), '\n'.join(
+                '  {0} ({1}): {2}'.format(
+                    hook.name, hook.status, hook.output.strip()[-500:])
+                for hook in hooks)))
+
+
+class Hook(object):
+
+    """ A command which is run after pasting. """
+
+    def __init__(self, name, command, requires=(), timeout=HOOK_TIMEOUT):
+        self.name = name
+        self.command = command
+        self.requires = list(requires)
+        self.timeout = timeout
+        self.status = None
+        self.seconds = 0
+        self.output = ''
+
+    def __repr__(self):
+        return "<Hook: {0}>".format(self.name)
+
+    def run(self, cwd):
+        """ Run the command in the directory and capture its output. """
+        logging.info('Run hook: {0}'.format(self.name))
+        start = time.time()
+
+        # Run the command in own process group to kill its children
+        if _compat.PY2:
+            options = dict(preexec_fn=getattr(os, 'setsid', None))
+        else:
+            options = dict(start_new_session=True)
+
+        try:
+            proc = subprocess.Popen(
+                self.command, shell=True, cwd=cwd, stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, **options)
+        except OSError as e:
+            self.status, self.output = FAILED, str(e)
+            return self
+
+        timer = None
+        if self.timeout:
+            timer = threading.Timer(self.timeout, self.kill, (proc,))
+            timer.start()
+        try:
+            output = proc.communicate()[0]
+        finally:
+            if timer:
+                timer.cancel()
+
+        self.seconds = time.time() - start
+        self.output = output.decode('utf-8', 'replace')
+        if self.status != TIMEOUT:
+            self.status = OK if proc.returncode == 0 else FAILED
+        logging.debug('Hook {0} output:\n{1}'.format(self.name, self.output))
+        return self
+
+    def kill(self, proc):
+        """ Kill the command's process group. """
+        self.status = TIMEOUT
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
+
+
+def get_environment():
+    """ Get Jinja environment which quotes values for the shell. """
+    if 'shell' not in ENVIRONMENTS:
+        from jinja2 import Environment
+
+        ENVIRONMENTS['shell'] = Environment(
+            finalize=lambda value: quote(_compat.text_type(value)))
+    return ENVIRONMENTS['shell']
+
+
+def read_hooks(parser, context=None):
+    """ Read hooks from the configuration.
+
+    :param context: Render commands with the context (values are quoted,
+        so they can't inject shell commands)
+    :raises ValueError: when hooks are misconfigured
+    :returns: A dictionary {name: hook}
+
+    """
+    hooks = OrderedDict()
+    for section, items in parser.sections.items():
+        if not section.startswith(SECTION_PREFIX):
+            continue
+
+        name = section[len(SECTION_PREFIX):]
+        items = dict(items.items(raw=True))
+        command = str(items.get('command', '')).strip()
+        if not command:
+            raise ValueError('Hook `{0}` has no command.'.format(name))
+
+        if context is not None:
+            command = get_environment().from_string(command).render(context)
+
+        try:
+            timeout = float(items.get('timeout', HOOK_TIMEOUT))
+        except ValueError:
+            raise ValueError('Hook `{0}` has invalid timeout.'.format(name))
+
+        requires = str(items.get('requires', '')).replace(' ', '')
+        hooks[name] = Hook(
+            name, command, filter(None, requires.split(',')), timeout)
+
+    for hook in hooks.values():
+        for name in hook.requires:
+            if name not in hooks:
+                raise ValueError('Hook `{0}` requires unknown `{1}`.'.format(
+                    hook.name, name))
+
+    return hooks
+
+
+def run_hooks(hooks, cwd):
+    """ Run hooks in the directory, independent hooks run concurrently.
+
+    Hooks which requirements are failed (or are in cycles) are skipped.
+
+    :raises HookError: when some of hooks are failed
+    :returns: A list of hooks (in order of finishing)
+
+    """
+    from concurrent.futures import (
+        FIRST_COMPLETED, ThreadPoolExecutor, wait)
+
+    start = time.time()
+    pending, running, finished = OrderedDict(hooks), {}, []
+    with ThreadPoolExecutor(max(len(hooks), 1)) as executor:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for name, hook in list(pending.items()):
+                    statuses = [hooks[r].status for r in hook.requires]
+                    if any(s not in (None, OK) for s in statuses):
+                        hook.status = SKIPPED
+                        finished.append(pending.pop(name))
+                        changed = True
+
+                    elif all(s == OK for s in statuses):
+                        running[executor.submit(hook.run, cwd)] = hook
+                        del pending[name]
+
+            if not running:
+                for hook in pending.values():
+                    logging.warning('Hook requires itself: {0}'.format(
+                        hook.name))
+                    hook.status = SKIPPED
+                    finished.append(hook)
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                finished.append(running.pop(future))
+                future.result()
+
+    logging.warning(summary(finished, time.time() - start))
+    failed = [hook for hook in finished if hook.status != OK]
+    if failed:
+        raise HookError(failed)
+
+    return finished
+
+
+def summary(hooks, seconds):
+    """ Format hooks timings (and the total run time). """
+    lines = ['Hooks:']
+    for hook in hooks:
+        lines.append('  {0:>10.2f}s  {1} ({2})'.format(
+            hook.seconds, hook.name, hook.status))
+    lines.append('  {0:>10.2f}s  total'.format(seconds))
+    return '\n'.join(lines)
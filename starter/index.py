@@ -0,0 +1,135 @@
+""" Persistent index of templates directories. """
+
+import json
+import logging
+import os
+from os import path as op
+
+from . import CFGFILE, CACHEDIR, profile
+from .fs import persistent, write_json
+
+
+class TemplateIndex(object):
+
+    """ Keep templates metadata for directories.
+
+    A directory entry is valid while the directory's mtime and mtimes of
+    its templates configurations are not changed, so scanning a cached
+    directory costs one `stat` per entry instead of parsing every
+    configuration.
+
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.dirs = None
+        self.changed = False
+
+    def load(self):
+        if self.dirs is not None:
+            return self.dirs
+
+        self.dirs = {}
+        if self.filename and op.exists(self.filename):
+            try:
+                with open(self.filename) as f:
+                    self.dirs = json.load(f)
+            except (IOError, ValueError) as e:
+                logging.debug('Templates index is broken: {0}'.format(e))
+        return self.dirs
+
+    def save(self):
+        """ Write the index atomically. """
+        if not (self.filename and self.changed and persistent()):
+            return
+
+        try:
+            write_json(self.filename, self.dirs)
+            self.changed = False
+        except (IOError, OSError) as e:
+            logging.debug('Templates index is not saved: {0}'.format(e))
+
+    def scan(self, path):
+        """ Get templates metadata for the path.
+
+        :returns: A dictionary {name: meta}
+
+        """
+        path = op.abspath(path)
+        entry = self.directory(path)
+        if entry is None:
+            return {}
+
+        templates = {}
+        for name in list(entry['entries']):
+            meta = self.template(entry, op.join(path, name))
+            if meta is not None:
+                templates[name] = meta
+
+        self.save()
+        return templates
+
+    def directory(self, path):
+        """ Get the directory's entry, list the directory when it's changed.
+
+        :returns: An entry or None when the directory doesn't exist
+
+        """
+        try:
+            mtime = op.getmtime(path)
+        except OSError:
+            return None
+
+        dirs = self.load()
+        entry = dirs.get(path)
+        if not entry or entry['mtime'] != mtime:
+            entry = dirs[path] = dict(mtime=mtime, entries={})
+            try:
+                names = os.listdir(path)
+            except OSError:
+                names = []
+            for name in names:
+                entry['entries'][name] = None
+            self.changed = True
+        return entry
+
+    def template(self, entry, path):
+        """ Get template's metadata, read it when the configuration is changed.
+
+        :returns: Metadata or None when the path isn't a template
+
+        """
+        name = op.basename(path)
+        meta = entry['entries'][name]
+        try:
+            cmtime = op.getmtime(op.join(path, CFGFILE))
+        except OSError:
+            if meta is not None:
+                entry['entries'][name] = None
+                self.changed = True
+            return None
+
+        if meta is None or meta['mtime'] != cmtime:
+            meta = entry['entries'][name] = self.read(path, cmtime)
+            self.changed = True
+            profile.count('index.miss')
+        else:
+            profile.count('index.hit')
+        return meta
+
+    @staticmethod
+    def read(path, mtime):
+        """ Read template's metadata. """
+        from .core import JinjaInterpolationNamespace
+
+        parser = JinjaInterpolationNamespace()
+        parser.read(op.join(path, CFGFILE))
+        params = dict(parser['params'] or {})
+        include = str(params.get('include', '')).replace(' ', '').split(',')
+        return dict(
+            path=path, mtime=mtime, params=params,
+            description=params.get('description', ''),
+            include=list(filter(None, include)))
+
+
+INDEX = TemplateIndex(CACHEDIR and op.join(CACHEDIR, 'index.json'))
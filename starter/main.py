@@ -22,7 +22,8 @@ PARSER.add_argument(
     'TARGET', nargs='?', default=CURDIR, help='Target path')
 
 PARSER.add_argument(
-    '-s', dest='source', help='Template\'s source')
+    '-s', dest='source',
+    help='Templates source: git repository (PATH[@REF]) or file://TARBALL')
 
 PARSER.add_argument(
     '-l', dest='level', default='warn', help='Verbose level (info)',
@@ -38,10 +39,79 @@ PARSER.add_argument(
 PARSER.add_argument(
     '-t', '--list', action="store_true", help='List available templates')
 
+PARSER.add_argument(
+    '--resolve', action="store_true",
+    help='Show templates with resolved includes')
+
 PARSER.add_argument(
     '-i', '--interactive', dest='interactive', action='store_true',
     help='Start in interactive mode')
 
+PARSER.add_argument(
+    '-b', '--batch',
+    help='Paste templates for every project from the file (JSONL, CSV, INI)')
+
+PARSER.add_argument(
+    '--pack', metavar='ARCHIVE',
+    help='Pack templates and their includes to the archive (*.zip)')
+
+PARSER.add_argument(
+    '--serve', metavar='ADDRESS',
+    help='Serve paste requests on HOST:PORT or a Unix socket path')
+
+PARSER.add_argument(
+    '--serve-hooks', action='store_true',
+    help='Run post-paste hooks of templates for serve requests')
+
+PARSER.add_argument(
+    '--serve-root', metavar='DIR',
+    help='Paste serve requests only into the directory (current directory)')
+
+PARSER.add_argument(
+    '--serve-public', action='store_true',
+    help='Serve on non-loopback hosts (requests are not authenticated)')
+
+PARSER.add_argument(
+    '-o', '--output-archive', metavar='ARCHIVE',
+    help='Paste to the archive (*.zip, *.tar[.gz|.bz2|.xz], - for stdout)')
+
+PARSER.add_argument(
+    '-w', '--workers', default=1, type=int,
+    help='Number of workers used to paste files')
+
+PARSER.add_argument(
+    '--processes', action='store_true',
+    help='Render templates in a process pool (use with --workers)')
+
+PARSER.add_argument(
+    '-m', '--materialize', default='copy',
+    choices=['copy', 'hardlink', 'symlink', 'reflink', 'kernel'],
+    help='How to materialize static files (copy)')
+
+PARSER.add_argument(
+    '-u', '--update', action='store_true',
+    help='Skip unchanged files (see .starter-manifest in the target)')
+
+PARSER.add_argument(
+    '-n', '--dry-run', action='store_true',
+    help='Show files which would be pasted and exit')
+
+PARSER.add_argument(
+    '--no-hooks', action='store_true',
+    help="Don't run post-paste hooks of templates")
+
+PARSER.add_argument(
+    '--watch', action='store_true',
+    help='Paste changed templates files again until interrupted')
+
+PARSER.add_argument(
+    '--cache-outputs', action='store_true',
+    help='Reuse pasted files for the same templates and context')
+
+PARSER.add_argument(
+    '--profile', nargs='?', const=True, metavar='REPORT',
+    help='Show timings summary (and write JSON report to the file)')
+
 PARSER.add_argument(
     '-v', '--version', action='version', version=__version__,
     help='Show {0} version'.format(__project__))
@@ -52,26 +122,129 @@ def main(*args):
     args = args or sys.argv[1:]
     params = PARSER.parse_args(args)
 
-    from .log import setup_logging
+    from .log import setup_logging, STREAM_HANDLER
     setup_logging(params.level.upper())
 
-    from .core import Starter
-    starter = Starter(params)
+    # Keep stdout for the archive
+    if params.output_archive == '-':
+        STREAM_HANDLER.stream = sys.stderr
 
-    if not starter.params.TEMPLATES or starter.params.list:
-        setup_logging('WARN')
-        for t in sorted(starter.iterate_templates()):
-            logging.warn("%s -- %s", t.name, t.params.get(
-                'description', 'no description'))
-        return True
+    if params.profile:
+        from .profile import Profiler, add_hook
 
+        profiler = Profiler()
+        add_hook(profiler)
+
+    from .core import Starter
     try:
-        starter.copy()
+        starter = Starter(params)
+    except ValueError as e:
+        logging.error(e)
+        sys.exit(1)
+
+    try:
+        return run(starter)
 
     except Exception as e: # noqa
         logging.error(e)
         sys.exit(1)
 
+    finally:
+        if params.profile:
+            logging.warning(profiler.summary())
+            if params.profile is not True:
+                profiler.dump(params.profile)
+
+
+def run(starter):
+    """ Run the mode selected by params (paste templates by default). """
+    if starter.params.serve:
+        return serve_templates(starter)
+
+    if not starter.params.TEMPLATES or starter.params.list:
+        return list_templates(starter)
+
+    for name, mode in MODES:
+        if getattr(starter.params, name):
+            return mode(starter)
+
+    starter.copy()
+
+
+def serve_templates(starter):
+    """ Serve paste requests until interrupted. """
+    from .server import serve
+
+    return serve(starter, starter.params.serve)
+
+
+def list_templates(starter):
+    """ Show available templates. """
+    from .log import setup_logging
+
+    setup_logging('WARN')
+    for t in sorted(starter.iterate_templates(), key=lambda t: t.name):
+        logging.warn("%s -- %s", t.name, t.params.get(
+            'description', 'no description'))
+    return True
+
+
+def resolve_templates(starter):
+    """ Show templates with resolved includes. """
+    from .log import setup_logging
+
+    setup_logging('WARN')
+    logging.warning(starter.resolve())
+    return True
+
+
+def pack_templates(starter):
+    """ Pack templates to the archive. """
+    from .bundle import pack
+
+    pack(starter, starter.params.pack)
+    return True
+
+
+def paste_batch(starter):
+    """ Paste templates for every project from the batch file. """
+    from .batch import batch, read_projects
+
+    results = batch(
+        starter, read_projects(starter.params.batch),
+        starter.params.workers, starter.params.processes)
+    if any(r[-1] for r in results):
+        sys.exit(1)
+    return True
+
+
+def watch_templates(starter):
+    """ Paste changed templates files until interrupted. """
+    from .watch import watch
+
+    watch(starter)
+    return True
+
+
+def paste_archive(starter):
+    """ Paste templates to the archive. """
+    from .archive import ArchiveFS
+
+    with ArchiveFS(
+            starter.params.output_archive, starter.params.TARGET) as fs:
+        starter.copy(fs=fs)
+    return True
+
+
+# Modes by params (checked in the order)
+MODES = (
+    ('resolve', resolve_templates),
+    ('pack', pack_templates),
+    ('batch', paste_batch),
+    ('watch', watch_templates),
+    ('output_archive', paste_archive),
+)
+
 
 if __name__ == '__main__':
     main()
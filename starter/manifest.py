@@ -0,0 +1,108 @@
+""" Track pasted files to skip unchanged ones on the next paste. """
+
+import hashlib
+import json
+import logging
+import os
+from os import path as op
+
+from .fs import write_json
+
+
+class Manifest(object):
+
+    """ Keep hashes of pasted files inputs in the target directory.
+
+    Inputs of a rendered file are the template's source (with referenced
+    templates) and the context's values used by the template. Inputs of a
+    static file are its source. A file is up to date when its inputs are
+    not changed and the target is not modified since the last paste.
+    Sources hashes are taken from the shared sources index (see
+    :class:`starter.cache.SourceIndex`).
+
+    """
+
+    filename = '.starter-manifest'
+
+    def __init__(self, target):
+        self.target = target
+        self.path = op.join(target, self.filename)
+        self.files, self.seen = {}, set()
+        try:
+            with open(self.path) as f:
+                self.files = json.load(f)['files']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def inputs(self, source, context=None, env=None, seen=None):
+        """ Get hash of the source's inputs or None when it's unknown.
+
+        Set `env` for templates. Templates which include or extend others
+        depend on the whole context.
+
+        """
+        from .cache import get_source_index
+
+        source_hash, names, refs = get_source_index().source(source, env)
+        digest = hashlib.sha1(source_hash.encode('ascii'))
+        if env is None:
+            return digest.hexdigest()
+
+        seen = seen or set([source])
+        for ref in refs:
+            if ref is None:
+                return None
+            names = sorted(context)
+            ref = op.join(env.loader.searchpath[0], ref)
+            if ref not in seen:
+                seen.add(ref)
+                ref = self.inputs(ref, context, env, seen)
+                if ref is None:
+                    return None
+                digest.update(ref.encode('ascii'))
+
+        digest.update(json.dumps(
+            [(name, context.get(name)) for name in names],
+            default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def fresh(self, target, key, inputs):
+        """ Check the target is pasted by the key with the same inputs. """
+        rel = op.relpath(target, self.target)
+        self.seen.add(rel)
+        record = self.files.get(rel)
+        if inputs is None or not record or record['inputs'].get(key) != inputs:
+            return False
+
+        try:
+            st = os.stat(target)
+        except OSError:
+            return False
+
+        return (st.st_size, st.st_mtime) == (record['size'], record['mtime'])
+
+    def update(self, target, key, inputs):
+        """ Save the target's inputs. """
+        rel = op.relpath(target, self.target)
+        self.files.setdefault(rel, dict(inputs={}, size=None, mtime=None))
+        self.files[rel]['inputs'][key] = inputs
+
+    def save(self):
+        """ Save records for files seen in the paste. """
+        from .cache import get_source_index
+
+        files = {}
+        for rel in self.seen:
+            try:
+                st = os.stat(op.join(self.target, rel))
+            except OSError:
+                continue
+            record = files[rel] = self.files.get(rel, dict(inputs={}))
+            record['size'], record['mtime'] = st.st_size, st.st_mtime
+
+        self.files = files
+        try:
+            write_json(self.path, dict(files=files))
+            get_source_index().save()
+        except (IOError, OSError) as e:
+            logging.debug('Manifest is not saved: {0}'.format(e))
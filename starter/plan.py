@@ -0,0 +1,197 @@
+""" Plan pastes before applying them.
+
+A plan is a deduplicated list of files operations across templates. When
+several templates paste the same target only the last one (in the
+templates order) is applied, so earlier outputs are never rendered to be
+overwritten. Directories are created once before files are written.
+
+Use `--dry-run` to show the plan without pasting: ::
+
+    $ starter py-package myproject --dry-run
+
+"""
+import logging
+from collections import OrderedDict
+from functools import partial
+from os import path as op
+
+from . import profile
+from .core import BINARY, FS, STATIC, TEXT, render_file, write_text
+from .pool import Pool
+
+
+# Operations
+COPY, WRITE, RENDER = 'copy', 'write', 'render'
+
+
+class Plan(object):
+
+    """ Deduplicated operations of a paste.
+
+    Operations `{target: (template, source, rel, action)}` are kept in the
+    order of templates, a template which pastes a planned target again
+    replaces its operation (the last template wins). Replaced templates are
+    kept in `replaced` `{target: [template names]}`.
+
+    :param root: The paste target (for showing the plan)
+
+    """
+
+    def __init__(self, root=''):
+        self.root = root
+        self.operations = OrderedDict()
+        self.replaced = {}
+
+    def __len__(self):
+        return len(self.operations)
+
+    def add(self, template, context, only=None):
+        """ Plan template's files.
+
+        :param only: Plan only the given sources
+
+        """
+        from .cache import get_source_index
+
+        for source, rel, target in template.targets(context):
+            if only is not None and source not in only:
+                continue
+
+            kind = template.kind(source)
+            action = RENDER
+            if kind in (STATIC, BINARY):
+                action = COPY
+            elif kind == TEXT:
+                action = WRITE
+
+            replaced = self.operations.pop(target, None)
+            if replaced is not None:
+                self.replaced.setdefault(target, []).append(replaced[0].name)
+                profile.count('plan.replaced')
+            self.operations[target] = template, source, rel, action
+
+        get_source_index().save()
+
+    @property
+    def directories(self):
+        """ Get directories of planned files (parents first). """
+        return sorted(set(op.dirname(target) for target in self.operations))
+
+    def apply(self, context, pool=None, strategy='copy', manifest=None,
+              fs=None):
+        """ Create directories and paste planned files using the pool.
+
+        Static files are materialized with the strategy, other files get
+        permissions of their sources too. When manifest is
+        given, files with unchanged inputs are skipped and rendered files
+        are not written if the target has the same content (bundles don't
+        support updates). Files are written to the disk unless other file
+        system is given (manifest isn't used then).
+
+        :returns: A dictionary {template: a list of pasted files}
+
+        """
+        if fs is not None:
+            manifest = None
+
+        for path in self.directories:
+            (fs or FS).make_directory(path)
+
+        groups, inputs = OrderedDict(), {}
+        for target, (t, source, rel, action) in self.operations.items():
+            update = manifest if t.updatable else None
+            job, inputs[target] = self.job(
+                target, t, source, rel, action, context, strategy, update, fs)
+
+            jobs = groups.setdefault(t, [])
+            if update and update.fresh(target, t.name, inputs[target]):
+                logging.debug('File is up to date: {0}'.format(target))
+                profile.count('update.skipped')
+                continue
+
+            jobs.append(job)
+
+        files = self.run(groups, pool or Pool(), fs)
+        if manifest:
+            self.save_inputs(manifest, files, inputs)
+
+        return files
+
+    @staticmethod
+    def job(target, t, source, rel, action, context, strategy, update, fs):
+        """ Make the pool's job for the operation.
+
+        :returns: A tuple (job, inputs for the manifest or None)
+
+        """
+        if action == COPY:
+            job = t.paste_file, (source, target, strategy, fs), False
+            inputs = update and update.inputs(source)
+
+        elif action == WRITE:
+            job = write_text, (source, target, bool(update), fs), False
+            inputs = update and update.inputs(source)
+
+        else:
+            job = render_file, (
+                t.path, rel, target, context, bool(update), fs,
+                t.mode(source)), fs is None
+            inputs = update and update.inputs(source, context, t.env)
+
+        return (target,) + job, inputs
+
+    @staticmethod
+    def run(groups, pool, fs=None):
+        """ Run jobs of templates (with profiling hooks, files are timed).
+
+        :param groups: A dictionary {template: a list of jobs}
+        :returns: A dictionary {template: a list of pasted files}
+
+        """
+        files = OrderedDict()
+        for t, jobs in groups.items():
+            logging.info('Paste template: {0}'.format(t.name))
+            files[t] = [job[0] for job in jobs]
+            if not profile.HOOKS:
+                pool.run(jobs)
+                continue
+
+            with profile.phase('paste:{0}'.format(t.name)):
+                results = pool.run([
+                    (target, partial(profile.timed, func), args, cpu)
+                    for target, func, args, cpu in jobs])
+
+            for target, (seconds, result) in zip(files[t], results):
+                profile.emit('file', target, seconds=seconds, size=(
+                    0 if result is False else (fs or t).getsize(target)))
+
+        return files
+
+    @staticmethod
+    def save_inputs(manifest, files, inputs):
+        """ Save inputs of pasted files of updatable templates. """
+        for t, targets in files.items():
+            if not t.updatable:
+                continue
+            for target in targets:
+                manifest.update(target, t.name, inputs[target])
+
+    def __str__(self):
+        lines = ['Directories:']
+        lines.extend(
+            '  {0}'.format(self.relpath(path)) for path in self.directories)
+        lines.append('Files:')
+        for target, (t, _, rel, action) in self.operations.items():
+            line = '  {0:<7}{1} ({2}: {3})'.format(
+                action, self.relpath(target), t.name, rel)
+            if target in self.replaced:
+                line += ' replaces {0}'.format(
+                    ', '.join(self.replaced[target]))
+            lines.append(line)
+        lines.append('{0} files, {1} directories, {2} writes replaced'.format(
+            len(self.operations), len(self.directories),
+            sum(len(names) for names in self.replaced.values())))
+        return '\n'.join(lines)
+
+    def relpath(self, path):
+        return op.relpath(path, self.root or '.')
@@ -0,0 +1,81 @@
+""" Run paste jobs serially or concurrently. """
+
+import logging
+
+
+class PasteError(Exception):
+
+    """ Collect errors from several paste jobs. """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(PasteError, self).__init__(
+            "{0} file(s) failed:\n{1}".format(len(errors), '\n'.join(
+                '  {0}: {1}'.format(target, e) for target, e in errors)))
+
+
+class Pool(object):
+
+    """ Execute jobs in a thread pool and CPU-heavy jobs in a process pool.
+
+    Job is a tuple `(target, func, args, cpu)`. With one worker jobs are
+    executed in place and the first error is raised as is.
+
+    """
+
+    def __init__(self, workers=1, processes=False):
+        self.workers = max(int(workers or 1), 1)
+        self.processes = processes
+        self._threads = self._procs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def threads(self):
+        if self._threads is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._threads = ThreadPoolExecutor(self.workers)
+        return self._threads
+
+    @property
+    def procs(self):
+        if self._procs is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._procs = ProcessPoolExecutor(self.workers)
+        return self._procs
+
+    def run(self, jobs):
+        """ Run jobs and return their results in order.
+
+        :raises PasteError: when some of jobs are failed
+
+        """
+        if self.workers == 1:
+            return [func(*args) for _, func, args, _ in jobs]
+
+        futures = [
+            (target, (self.procs if cpu and self.processes else self.threads)
+             .submit(func, *args)) for target, func, args, cpu in jobs]
+
+        results, errors = [], []
+        for target, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e: # noqa
+                logging.debug('Paste failed: {0}: {1}'.format(target, e))
+                errors.append((target, e))
+
+        if errors:
+            raise PasteError(errors)
+
+        return results
+
+    def close(self):
+        for executor in (self._threads, self._procs):
+            if executor is not None:
+                executor.shutdown()
+        self._threads = self._procs = None
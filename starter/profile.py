@@ -0,0 +1,133 @@
+""" Collect paste metrics.
+
+Starter emits events to registered hooks: ::
+
+    from starter import profile
+
+    def hook(event, name, **data):
+        ...
+
+    profile.add_hook(hook)
+
+Events are:
+
+* `phase` -- a paste phase is finished (`seconds`);
+* `file` -- a file is pasted (`seconds`, `size` -- bytes written);
+* `count` -- a counter is incremented (`value`), e.g. cache hits.
+
+Files events for process pools workers are emitted by the main process,
+other events from the workers are not collected.
+
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+HOOKS = []
+
+
+def add_hook(hook):
+    """ Register a hook. """
+    HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    """ Unregister a hook. """
+    HOOKS.remove(hook)
+
+
+def emit(event, name, **data):
+    """ Send event to hooks. """
+    for hook in HOOKS:
+        hook(event, name, **data)
+
+
+def count(name, value=1):
+    """ Increment a counter. """
+    if HOOKS:
+        emit('count', name, value=value)
+
+
+@contextmanager
+def phase(name):
+    """ Measure a phase. """
+    start = time.time()
+    try:
+        yield
+    finally:
+        if HOOKS:
+            emit('phase', name, seconds=time.time() - start)
+
+
+def timed(func, *args):
+    """ Call the function and return (seconds, result). """
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+class Profiler(object):
+
+    """ A hook which aggregates metrics. """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.files = []
+        self.counters = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __call__(self, event, name, **data):
+        with self.lock:
+            if event == 'phase':
+                seconds, calls = self.phases.get(name, (0, 0))
+                self.phases[name] = seconds + data['seconds'], calls + 1
+
+            elif event == 'file':
+                self.files.append((name, data['seconds'], data['size']))
+
+            elif event == 'count':
+                self.counters[name] = self.counters.get(name, 0) + (
+                    data['value'])
+
+    def report(self):
+        """ Get metrics as a dictionary. """
+        return dict(
+            phases=[
+                dict(name=name, seconds=seconds, calls=calls)
+                for name, (seconds, calls) in self.phases.items()],
+            files=[
+                dict(path=path, seconds=seconds, size=size)
+                for path, seconds, size in self.files],
+            counters=self.counters,
+            bytes=sum(f[2] for f in self.files),
+        )
+
+    def dump(self, filename):
+        """ Write the report as JSON. """
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self, limit=10):
+        """ Format the summary (the slowest phases and files first). """
+        lines = ['Phases:']
+        for name, (seconds, calls) in sorted(
+                self.phases.items(), key=lambda p: p[1][0], reverse=True):
+            lines.append('  {0:>10.2f}ms  {1} ({2})'.format(
+                seconds * 1000, name, calls))
+
+        lines.append('Files: {0} ({1} bytes written)'.format(
+            len(self.files), sum(f[2] for f in self.files)))
+        for path, seconds, size in sorted(
+                self.files, key=lambda f: f[1], reverse=True)[:limit]:
+            lines.append('  {0:>10.2f}ms  {1} ({2} bytes)'.format(
+                seconds * 1000, path, size))
+
+        if self.counters:
+            lines.append('Counters:')
+            for name, value in self.counters.items():
+                lines.append('  {0:>10}  {1}'.format(value, name))
+
+        return '\n'.join(lines)
@@ -0,0 +1,45 @@
+""" Context items which are computed only when templates use them.
+
+A provider is a function which gets the starter and returns the item's
+value. Providers are called once per paste and don't redefine items from
+configurations or the command line: ::
+
+    import socket
+    from starter.providers import add_provider
+
+    add_provider('_HOSTNAME', lambda starter: socket.gethostname())
+
+"""
+import subprocess
+from collections import OrderedDict
+from os import environ
+
+
+PROVIDERS = OrderedDict()
+
+
+def add_provider(name, func):
+    """ Register a provider for the context item. """
+    PROVIDERS[name] = func
+
+
+def git_config(key):
+    """ Get value from git configuration or None. """
+    try:
+        return subprocess.check_output(
+            ('git', 'config', '--get', key),
+            stderr=subprocess.STDOUT).decode('utf-8').strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def now(starter):
+    from datetime import datetime
+
+    return datetime.now()
+
+
+add_provider('_USER', lambda starter: environ.get('USER'))
+add_provider('_DATETIME', now)
+add_provider('_GIT_AUTHOR', lambda starter: git_config('user.name'))
+add_provider('_GIT_EMAIL', lambda starter: git_config('user.email'))
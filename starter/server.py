@@ -0,0 +1,330 @@
+""" Paste templates by requests to a long-running process.
+
+The server keeps the templates index, compiled Jinja environments and
+templates files lists in memory, so a request costs only rendering: ::
+
+    $ starter --serve 127.0.0.1:8000
+    $ starter --serve /tmp/starter.sock
+
+Addresses like `HOST:PORT` are served over TCP (only loopback hosts unless
+`--serve-public` is given, requests aren't authenticated), other addresses
+are paths to Unix sockets. Targets are paths in the serve root (`--serve-root`,
+the current directory by default). Requests and responses are JSON: ::
+
+    POST /paste
+    {"templates": ["python-package"], "target": "path/to/project",
+     "context": {"AUTHOR_NAME": "John"}, "update": false}
+
+    {"templates": ["python-package"], "files": [...], "seconds": 0.004}
+
+    GET /templates
+    {"templates": [{"name": ..., "description": ...}, ...]}
+
+Post-paste hooks are run only with `--serve-hooks` (requests can disable
+them with `"no_hooks": true`).
+
+Caches are validated on every request: changed configurations and
+directories of templates are read again (the templates lookup is kept while
+templates directories are not changed), changed Jinja templates are
+recompiled.
+
+"""
+import copy
+import json
+import logging
+import os
+import re
+import threading
+import time
+from os import path as op
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+from inirama import Namespace
+
+from . import CURDIR
+from .core import Starter
+from .index import INDEX
+
+
+TCP_RE = re.compile(r'^[\w.-]*:\d+$')
+
+LOOPBACK_RE = re.compile(r'^(|localhost|127\.\d+\.\d+\.\d+)$')
+
+# Options which can be defined by requests
+OPTIONS = (
+    'update', 'materialize', 'workers', 'processes', 'cache_outputs',
+    'no_hooks')
+
+
+class CachedStarter(Starter):
+
+    """ Reuse templates (and their files lists) between requests. """
+
+    def __init__(self, service, *args, **kwargs):
+        super(CachedStarter, self).__init__(*args, **kwargs)
+        self.service = service
+
+    def get_template(self, name):
+        template = super(CachedStarter, self).get_template(name)
+        if not op.isdir(template.path):
+            return template
+
+        with self.service.lock:
+            cached, dirs = self.service.templates.get(
+                template.path, (None, None))
+            if cached is None or not valid(dirs):
+                cached, dirs = template, [
+                    (root, op.getmtime(root))
+                    for root, _, _ in os.walk(template.path)]
+                self.service.templates[template.path] = cached, dirs
+
+        # Params are validated by the templates index
+        cached._params = template._params
+        return cached
+
+    @property
+    def lookup(self):
+        return self.service.lookup(self.dirs)
+
+    def read_config(self, parser, filename, update=True):
+        self.service.read_config(parser, filename, update)
+
+    def configure(self, template):
+        if not op.isdir(template.path):
+            return super(CachedStarter, self).configure(template)
+        self.read_config(self.parser, template.configuration, update=False)
+
+
+def get_mtime(path):
+    """ Get mtime of the path or None when it doesn't exist. """
+    try:
+        return op.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+
+def valid(dirs):
+    """ Check that directories are not changed (files aren't added). """
+    return all(get_mtime(root) == mtime for root, mtime in dirs)
+
+
+class Service(object):
+
+    """ Handle requests with the starter's settings. """
+
+    def __init__(self, starter):
+        self.starter = starter
+        self.root = op.realpath(starter.option('serve_root') or CURDIR)
+        self.templates = {}
+        self.configs = {}
+        self.lookups = {}
+        self.lock = threading.RLock()
+
+    def lookup(self, dirs):
+        """ Get templates lookup for the directories.
+
+        The lookup is built again when some of directories is changed.
+
+        """
+        dirs = tuple(dirs)
+        with self.lock:
+            stamps, table = self.lookups.get(dirs, (None, None))
+            if stamps is None or not valid(stamps):
+                stamps, table = [(dd, get_mtime(dd)) for dd in dirs], {}
+                for dd in dirs:
+                    table.update(INDEX.scan(dd))
+                self.lookups[dirs] = stamps, table
+        return table
+
+    def read_config(self, parser, filename, update=True):
+        """ Read the configuration to the parser.
+
+        Configurations are parsed once (again when they are changed).
+
+        """
+        mtime = get_mtime(filename)
+        if mtime is None:
+            return
+
+        with self.lock:
+            cached, sections = self.configs.get(filename, (None, None))
+            if cached != mtime:
+                namespace = Namespace()
+                namespace.read(filename)
+                sections = [
+                    (name, list(section.items()))
+                    for name, section in namespace.sections.items()]
+                self.configs[filename] = mtime, sections
+
+        for name, items in sections:
+            section = parser[name]
+            for key, value in items:
+                if update or key not in section:
+                    section[key] = value
+
+    def get_target(self, target):
+        """ Get the request's target path in the serve root.
+
+        :raises ValueError: when the target is outside of the root
+
+        """
+        path = op.realpath(op.join(self.root, target or ''))
+        if path != self.root and not path.startswith(
+                self.root.rstrip(op.sep) + op.sep):
+            raise ValueError('Target is outside of the serve root.')
+        return path
+
+    def paste(self, request):
+        """ Paste templates to the request's target.
+
+        :returns: A response dictionary
+
+        """
+        start = time.time()
+        templates = request.get('templates') or []
+        if not isinstance(templates, list):
+            templates = list(filter(None, str(templates).split(',')))
+        if not templates:
+            raise ValueError('Templates are not defined.')
+
+        params = copy.copy(self.starter.params)
+        params.TEMPLATES = templates
+        params.TARGET = self.get_target(request.get('target'))
+        params.interactive = False
+
+        options = dict(self.starter.options)
+        options.update(
+            (name, request[name]) for name in OPTIONS if name in request)
+
+        # Directories (with the resolved source) are copied from the starter
+        options['source'] = None
+
+        # Hooks run shell commands, the operator should enable them
+        if not self.starter.option('serve_hooks'):
+            options['no_hooks'] = True
+
+        starter = CachedStarter(self, params, **options)
+        starter.dirs = list(self.starter.dirs)
+
+        # Requests context overrides configurations
+        starter.parser.default.update(request.get('context') or {})
+
+        # The templates index isn't thread safe
+        with self.lock:
+            resolved = starter.prepare_templates()
+
+        files = starter.copy(resolved)
+        return dict(
+            templates=[t.name for t in resolved],
+            files=[op.relpath(f, params.TARGET) for ff in files for f in ff],
+            seconds=time.time() - start)
+
+    def list(self):
+        """ List available templates. """
+        with self.lock:
+            templates = self.starter.iterate_templates()
+        return dict(templates=[
+            dict(name=t.name, description=t.params.get('description', ''))
+            for t in sorted(templates, key=lambda t: t.name)])
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    """ Serve JSON requests. """
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/templates':
+            return self.respond(404, dict(error='Not found.'))
+        self.respond(200, self.server.service.list())
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/paste':
+            return self.respond(404, dict(error='Not found.'))
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ValueError('Request should be an object.')
+            response = self.server.service.paste(request)
+
+        except ValueError as e:
+            return self.respond(400, dict(error=str(e)))
+
+        except Exception as e: # noqa
+            logging.exception('Paste is failed.')
+            return self.respond(500, dict(error=str(e)))
+
+        self.respond(200, response)
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return self.client_address and self.client_address[0] or 'unix'
+
+    def log_message(self, format, *args):
+        logging.info(format % args)
+
+
+class TCPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class UnixServer(ThreadingMixIn, UnixStreamServer):
+
+    daemon_threads = True
+
+    def server_bind(self):
+        if op.exists(self.server_address):
+            os.remove(self.server_address)
+        UnixStreamServer.server_bind(self)
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        if op.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def make_server(starter, address):
+    """ Create server for the address (`HOST:PORT` or a socket path).
+
+    :raises ValueError: when the host isn't loopback and `serve_public`
+        option isn't set
+
+    """
+    if TCP_RE.match(address):
+        host, port = address.rsplit(':', 1)
+        if not LOOPBACK_RE.match(host) and not starter.option('serve_public'):
+            raise ValueError(
+                'Serving on `{0}` is allowed with --serve-public.'.format(
+                    host))
+        server = TCPServer((host or '127.0.0.1', int(port)), Handler)
+    else:
+        server = UnixServer(op.abspath(address), Handler)
+    server.service = Service(starter)
+    return server
+
+
+def serve(starter, address):
+    """ Serve requests until interrupted. """
+    server = make_server(starter, address)
+    logging.warning('Serve on {0}'.format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
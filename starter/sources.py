@@ -0,0 +1,171 @@
+""" Load templates from git repositories and tarballs.
+
+Sources are: ::
+
+    path/to/repository          -- git repository (HEAD)
+    path/to/repository@v1.0     -- git repository at the ref
+    file:///path/to/templates.tar.gz
+
+Sources are extracted once to the cache (`STARTER_CACHE/sources`) by the
+commit or the tarball's hash. Extraction is locked, so many processes can
+share the cache.
+
+"""
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from contextlib import contextmanager
+from os import path as op
+
+from . import CFGFILE, CACHEDIR
+
+
+FILE_SCHEME = 'file://'
+
+
+def resolve(source):
+    """ Get templates directory for the source.
+
+    :raises ValueError: when the source can't be loaded
+    :returns: A path to directory
+
+    """
+    if source.startswith(FILE_SCHEME):
+        filename = source[len(FILE_SCHEME):]
+        if not op.isfile(filename):
+            raise ValueError('Tarball `{0}` not found.'.format(filename))
+        return materialize('tar-' + file_hash(filename), extract, filename)
+
+    path, ref = source, 'HEAD'
+    if not op.isdir(path) and '@' in source:
+        path, ref = source.rsplit('@', 1)
+
+    if not op.isdir(path):
+        raise ValueError('Source `{0}` not found.'.format(source))
+
+    # Plain directories are used as is
+    if not op.exists(op.join(path, '.git')) and not op.exists(
+            op.join(path, 'HEAD')):
+        return op.abspath(path)
+
+    commit = git(path, 'rev-parse', '--verify', ref + '^{commit}').strip()
+    return materialize('git-' + commit, archive, path, commit)
+
+
+def file_hash(filename):
+    """ Get SHA1 of the file. """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def git(path, *args):
+    """ Run git command in the repository. """
+    try:
+        return subprocess.check_output(
+            ('git', '-C', path) + args, stderr=subprocess.STDOUT).decode(
+                'utf-8')
+    except (OSError, subprocess.CalledProcessError) as e:
+        output = getattr(e, 'output', b'') or b''
+        raise ValueError('Git source `{0}` failed: {1}'.format(
+            path, output.decode('utf-8', 'replace').strip() or e))
+
+
+def materialize(key, func, *args):
+    """ Extract source to the cache once.
+
+    :param func: A function which extracts the source to a directory
+
+    """
+    if not CACHEDIR:
+        target = tempfile.mkdtemp(prefix='starter-')
+        func(target, *args)
+        return root(target)
+
+    directory = op.join(CACHEDIR, 'sources')
+    target = op.join(directory, key)
+    if op.isdir(target):
+        return root(target)
+
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    with lock(target + '.lock'):
+        if not op.isdir(target):
+            logging.info('Extract source: {0}'.format(key))
+            tmp = tempfile.mkdtemp(dir=directory, suffix='.tmp')
+            try:
+                func(tmp, *args)
+                os.rename(tmp, target)
+                tmp = None
+            finally:
+                if tmp:
+                    shutil.rmtree(tmp, ignore_errors=True)
+
+    return root(target)
+
+
+@contextmanager
+def lock(filename):
+    """ Lock the file (exclusively, between processes). """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    with open(filename, 'a') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def root(path):
+    """ Skip the top directory of archives like `templates-1.0/`. """
+    names = os.listdir(path)
+    if len(names) == 1 and op.isdir(op.join(path, names[0])) and \
+            not op.exists(op.join(path, names[0], CFGFILE)):
+        return op.join(path, names[0])
+    return path
+
+
+def archive(target, path, commit):
+    """ Export the commit's tree to target. """
+    fd, tmp = tempfile.mkstemp(suffix='.tar')
+    os.close(fd)
+    try:
+        git(path, 'archive', '--format=tar', '-o', tmp, commit)
+        extract(target, tmp)
+    finally:
+        os.remove(tmp)
+
+
+def extract(target, filename):
+    """ Extract files and directories of the tarball to target.
+
+    Links and paths out of the target are skipped.
+
+    """
+    with tarfile.open(filename) as tar:
+        members = []
+        for member in tar.getmembers():
+            name = op.normpath(member.name)
+            if not (member.isfile() or member.isdir()) or op.isabs(name) or \
+                    name.split(os.sep)[0] == '..':
+                logging.debug('Skip archive member: {0}'.format(member.name))
+                continue
+            members.append(member)
+        tar.extractall(target, members)
@@ -0,0 +1,348 @@
+""" Paste templates again when their sources are changed.
+
+Outputs depend on their sources, rendered files also depend on templates
+they include, import or extend. When sources are changed only their
+outputs are pasted again. Changed configurations, added or removed files
+make the whole paste again.
+
+Changes are waited with inotify (Linux, created directories are watched
+too) or by polling files stats.
+
+"""
+import io
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from os import path as op
+
+from .core import TEMPLATE, Starter
+from .pool import Pool
+
+
+# Polling interval (seconds)
+WATCH_INTERVAL = 0.2
+
+# Wait for other changes after notification (editors write files in steps)
+WATCH_DELAY = 0.02
+
+
+class Inotify(object):
+
+    """ Wait for changes in directories (Linux only). """
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    # IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    mask = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+
+    # Directory is created or moved in: IN_CREATE | IN_MOVED_TO, IN_ISDIR
+    created, isdir = 0x100 | 0x80, 0x40000000
+
+    # struct inotify_event without the name
+    event = struct.Struct('iIII')
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith('linux'):
+            raise OSError('Inotify is not supported.')
+
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'Inotify is not available.')
+        self.watches = set()
+
+        # {watch descriptor: path}
+        self.paths = {}
+
+    def add(self, path):
+        """ Watch the directory. """
+        if path in self.watches:
+            return
+        name = path
+        if not isinstance(name, bytes):
+            name = name.encode(sys.getfilesystemencoding())
+        wd = self.libc.inotify_add_watch(self.fd, name, self.mask)
+        if wd >= 0:
+            self.watches.add(path)
+            self.paths[wd] = path
+
+    def wait(self, timeout=None):
+        """ Wait for events.
+
+        :returns: True when something is changed
+
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+
+        time.sleep(WATCH_DELAY)
+        for path in self.directories(os.read(self.fd, 1024 * 1024)):
+            for root, _, _ in os.walk(path):
+                self.add(root)
+        return True
+
+    def directories(self, data):
+        """ Get directories created in watched directories from events. """
+        offset, encoding = 0, sys.getfilesystemencoding()
+        while offset + self.event.size <= len(data):
+            wd, mask, _, size = self.event.unpack_from(data, offset)
+            offset += self.event.size + size
+            if wd not in self.paths or not (
+                    mask & self.isdir and mask & self.created):
+                continue
+            name = data[offset - size:offset].rstrip(b'\0')
+            yield op.join(self.paths[wd], name.decode(encoding))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(object):
+
+    """ Track outputs dependencies and paste outputs of changed sources. """
+
+    def __init__(self, starter):
+        self.starter = starter
+        self.templates = []
+        self.context = {}
+        self.snapshot = {}
+
+        # {target: (template, source)} -- the last template wins
+        self.owners = {}
+
+        # {path: targets which depend on the file}
+        self.dependents = {}
+
+        self.notifier = None
+
+    def paste(self):
+        """ Paste all templates and track their dependencies.
+
+        Configurations are read again, hooks are not run.
+
+        :returns: A list of pasted files
+
+        """
+        options = dict(self.starter.options, no_hooks=True)
+        starter = Starter(self.starter.params, **options)
+        starter.dirs = list(self.starter.dirs)
+        self.starter = starter
+
+        # Directories could be replaced, so watch them again
+        if self.notifier:
+            self.notifier.close()
+        try:
+            self.notifier = Inotify()
+        except (OSError, AttributeError) as e:
+            logging.debug('Poll files, inotify is not used: {0}'.format(e))
+            self.notifier = None
+
+        self.templates = starter.prepare_templates()
+        self.snapshot = self.scan()
+
+        # The same context as for copying (see :meth:`stale`)
+        self.context = starter.prepare_context(self.templates)
+        starter.make_directory(starter.params.TARGET)
+        files = starter.paste(self.templates, self.context)
+
+        self.track()
+        return [f for ff in files for f in ff]
+
+    def update(self, targets):
+        """ Paste the targets by their owners.
+
+        :returns: A list of pasted files
+
+        """
+        only = {}
+        for target in targets:
+            t, source = self.owners[target]
+            only.setdefault(t, set()).add(source)
+
+        files = []
+        with Pool(self.starter.option('workers', 1),
+                  self.starter.option('processes', False)) as pool:
+            for t in self.templates:
+                if t in only:
+                    files.extend(t.paste_files(
+                        self.context, pool, self.starter.option('materialize'),
+                        only=only[t]))
+        return files
+
+    def check(self):
+        """ Paste outputs of changed files.
+
+        :returns: A list of pasted files
+
+        """
+        snapshot = self.scan()
+        changed = [
+            path for path in set(snapshot) | set(self.snapshot)
+            if snapshot.get(path) != self.snapshot.get(path)]
+        if not changed:
+            return []
+
+        start = time.time()
+        self.snapshot = snapshot
+        if any(self.stale(path, snapshot) for path in changed):
+            files = self.paste()
+
+        else:
+            targets = set()
+            for path in changed:
+                targets.update(self.dependents[path])
+            files = self.update(targets)
+
+        logging.warning('Pasted {0} files in {1:.1f}ms'.format(
+            len(files), (time.time() - start) * 1000))
+        return files
+
+    def stale(self, path, snapshot):
+        """ Check that the whole paste is needed for the changed file.
+
+        Removed, added files and templates which use items not in the
+        context (only used items are interpolated) make the whole paste.
+
+        """
+        from .cache import get_source_index
+        from .providers import PROVIDERS
+
+        if snapshot.get(path) is None or path not in self.dependents:
+            return True
+
+        items = self.starter.parser.default
+        for target in self.dependents[path]:
+            t, _ = self.owners[target]
+            if t.kind(path) != TEMPLATE:
+                continue
+            _, names, _ = get_source_index().source(path, t.env)
+            if any(name not in self.context and (
+                    name in items or name in PROVIDERS) for name in names):
+                return True
+
+        return False
+
+    def track(self):
+        """ Collect outputs dependencies. """
+        self.owners, self.dependents = {}, {}
+        for t in self.templates:
+            if not op.isdir(t.path):
+                continue
+            for source, rel, target in t.targets(self.context):
+                self.owners[target] = t, source
+                self.dependents[source] = set()
+
+        for target, (t, source) in self.owners.items():
+            for path in self.inputs(t, source):
+                self.dependents.setdefault(path, set()).add(target)
+
+    @staticmethod
+    def inputs(t, source):
+        """ Get files which the source depends on. """
+        if t.kind(source) != TEMPLATE:
+            return set([source])
+
+        from jinja2 import TemplateSyntaxError, meta
+
+        inputs, stack = set(), [source]
+        while stack:
+            path = stack.pop()
+            if path in inputs or not op.isfile(path):
+                continue
+
+            inputs.add(path)
+            try:
+                with io.open(path, encoding='utf-8') as f:
+                    ast = t.env.parse(f.read())
+                refs = list(meta.find_referenced_templates(ast))
+            except (TemplateSyntaxError, IOError, OSError, ValueError):
+                refs = [None]
+
+            # Dynamic references could use any template's file
+            if None in refs:
+                inputs.update(s for s, _, _ in t.paths)
+                break
+
+            stack.extend(op.join(t.path, ref) for ref in refs)
+
+        return inputs
+
+    @property
+    def configs(self):
+        configs = list(self.starter.default_configs)
+        if self.starter.params.config:
+            configs.append(op.abspath(self.starter.params.config))
+        return configs
+
+    def scan(self):
+        """ Get stats of templates files and configurations.
+
+        :returns: A dictionary {path: (mtime, size)}, missed configurations
+            are None
+
+        """
+        stats = dict((path, None) for path in self.configs)
+        for path in self.configs:
+            self.watch(op.dirname(path))
+
+        for t in self.templates:
+            stats.update((path, None) for path in self.walk(t))
+
+        for path in stats:
+            try:
+                st = os.stat(path)
+                stats[path] = st.st_mtime, st.st_size
+            except OSError:
+                pass
+
+        return stats
+
+    def walk(self, t):
+        """ Watch directories of the template and iterate its files. """
+        if not op.isdir(t.path):
+            return
+
+        for root, _, files in os.walk(t.path):
+            self.watch(root)
+            for name in files:
+                yield op.join(root, name)
+
+    def watch(self, path):
+        """ Watch the directory for changes (with inotify only). """
+        if self.notifier:
+            self.notifier.add(path)
+
+    def wait(self, interval=WATCH_INTERVAL):
+        """ Wait for changes. """
+        if self.notifier:
+            self.notifier.wait()
+        else:
+            time.sleep(interval)
+
+
+def watch(starter, interval=WATCH_INTERVAL):
+    """ Paste templates and paste them again on changes until interrupted. """
+    watcher = Watcher(starter)
+    watcher.paste()
+    logging.warning('Watch templates (press Ctrl+C to stop)')
+    try:
+        while True:
+            watcher.wait(interval)
+            try:
+                watcher.check()
+            except Exception as e: # noqa
+                logging.error(e)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        if watcher.notifier:
+            watcher.notifier.close()
@@ -1,3 +1,5 @@
+import os
+import sys
 from os import path as op
 import pytest
 
@@ -7,6 +9,23 @@ from starter.core import Starter, Template
 TESTDIR = op.join(op.dirname(__file__), 'tests', 'templates')
 
 
+@pytest.fixture(autouse=True)
+def cachedir(monkeypatch, tmpdir_factory):
+    """ Keep caches of every test in a temporary directory. """
+    from starter import cache, core, index, sources
+
+    directory = str(tmpdir_factory.mktemp('cache'))
+    monkeypatch.setenv('STARTER_CACHE', directory)
+    monkeypatch.setattr(cache, 'CACHEDIR', directory)
+    monkeypatch.setattr(cache, 'CACHES', {})
+    monkeypatch.setattr(sources, 'CACHEDIR', directory)
+    monkeypatch.setattr(core, 'ENVIRONMENTS', {})
+    monkeypatch.setattr(
+        index.INDEX, 'filename', op.join(directory, 'index.json'))
+    monkeypatch.setattr(index.INDEX, 'dirs', None)
+    return directory
+
+
 @pytest.fixture(scope='module')
 def params():
     from starter.log import setup_logging
@@ -40,7 +59,8 @@ def test_template(params):
     t = Template('py-package', dirs=Starter.default_tmpldirs)
     assert t.path.endswith('starter/templates/py-package')
 
-    T = lambda n: Template(n, dirs=[TESTDIR])
+    def T(name):
+        return Template(name, dirs=[TESTDIR])
 
     # Check base template properties
     t = T('custom')
@@ -98,6 +118,836 @@ def test_starter_copy(params, tmpdir):
         assert f
 
 
+def read_tree(path):
+    """ Read files in the path to dictionary. """
+    tree = {}
+    for root, _, files in os.walk(path):
+        for f in files:
+            with open(op.join(root, f), 'rb') as ff:
+                tree[op.relpath(op.join(root, f), path)] = ff.read()
+    return tree
+
+
+def test_interpolation():
+    from starter.core import JinjaInterpolationNamespace, EXPRESSIONS
+
+    parser = JinjaInterpolationNamespace(USER='john')
+    parser.parse('\n'.join(
+        ['AUTHOR = {{USER}}', 'EMAIL = {{AUTHOR}}@gmail.com'] +
+        ['KEY%s = {{AUTHOR}}-%s' % (n, n) for n in range(100)]))
+
+    EXPRESSIONS.clear()
+    assert parser.default['EMAIL'] == 'john@gmail.com'
+    assert dict(parser.default.items())['KEY99'] == 'john-99'
+    assert sorted(EXPRESSIONS) == ['{{AUTHOR}}', '{{USER}}']
+
+    parser.default['USER'] = 'bob'
+    assert parser.default['KEY10'] == 'bob-10'
+    parser.default.pop('USER')
+    assert parser.default['KEY10'] == '-10'
+
+
+def test_starter_copy_parallel(params, tmpdir):
+    params.TEMPLATES = ['py-package']
+    serial, parallel = str(tmpdir.mkdir('serial')), str(tmpdir.mkdir('pool'))
+
+    params.TARGET = serial
+    Starter(params).copy()
+
+    params.TARGET = parallel
+    Starter(params, workers=4).copy()
+
+    tree = read_tree(serial)
+    assert 'docs/conf.py' in tree
+    assert read_tree(parallel) == tree
+
+    params.TARGET = str(tmpdir.mkdir('procs'))
+    Starter(params, workers=2, processes=True).copy()
+    assert read_tree(params.TARGET) == tree
+
+
+def test_pool_errors():
+    from starter.pool import Pool, PasteError
+
+    def fail(n):
+        raise IOError(n)
+
+    with Pool(2) as pool:
+        assert pool.run([(n, str, (n,), False) for n in range(3)]) == [
+            '0', '1', '2']
+        with pytest.raises(PasteError) as info:
+            pool.run([(n, fail, (n,), False) for n in range(3)])
+
+    assert [t for t, _ in info.value.errors] == [0, 1, 2]
+
+
+def test_bytecode_cache(tmpdir):
+    from jinja2 import Environment, FileSystemLoader
+    from starter.cache import BytecodeCache
+
+    cache = BytecodeCache(str(tmpdir.mkdir('cache')))
+
+    def env():
+        return Environment(
+            loader=FileSystemLoader(op.join(TESTDIR, 'custom')),
+            bytecode_cache=cache)
+
+    assert env().get_template('dir/template.j2')
+    assert len(os.listdir(cache.directory)) == 1
+
+    compiled = []
+    e = env()
+    e.compile = lambda *args, **kwargs: compiled.append(args)
+    assert e.get_template('dir/template.j2')
+    assert not compiled
+
+    cache.max_size = 0
+    cache.prune()
+    assert not os.listdir(cache.directory)
+
+
+def test_template_index(tmpdir):
+    from starter.index import TemplateIndex
+
+    filename = str(tmpdir.join('index.json'))
+    tmpldir = tmpdir.mkdir('templates')
+    tmpldir.mkdir('first').join('starter.ini').write(
+        '[params]\ndescription = First\ninclude = a, b')
+    tmpldir.mkdir('nothing')
+
+    index = TemplateIndex(filename)
+    templates = index.scan(str(tmpldir))
+    assert list(templates) == ['first']
+    assert templates['first']['description'] == 'First'
+    assert templates['first']['include'] == ['a', 'b']
+    assert op.exists(filename)
+
+    index = TemplateIndex(filename)
+    index.read = None
+    assert index.scan(str(tmpldir))['first']['description'] == 'First'
+
+    cfg = tmpldir.join('first', 'starter.ini')
+    cfg.write('[params]\ndescription = Changed')
+    cfg.setmtime(cfg.mtime() + 10)
+    tmpldir.join('nothing', 'starter.ini').write('')
+
+    index = TemplateIndex(filename)
+    templates = index.scan(str(tmpldir))
+    assert sorted(templates) == ['first', 'nothing']
+    assert templates['first']['description'] == 'Changed'
+
+
+def test_batch(params, tmpdir):
+    from starter.batch import batch, read_projects
+
+    projects = tmpdir.join('projects.jsonl')
+    projects.write('\n'.join((
+        '{"TARGET": "%s", "customkey": "first"}' % tmpdir.join('first'),
+        '',
+        '{"TARGET": "%s", "customkey": "second"}' % tmpdir.join('second'),
+        '{"customkey": "notarget"}',
+    )))
+    assert len(read_projects(str(projects))) == 3
+
+    ini = tmpdir.join('projects.ini')
+    ini.write('[first]\ncustomkey = first\n[second]\nTARGET = other')
+    assert read_projects(str(ini)) == [
+        dict(TARGET='first', customkey='first'), dict(TARGET='other')]
+
+    csv = tmpdir.join('projects.csv')
+    csv.write('TARGET,customkey\nfirst,first\n')
+    assert read_projects(str(csv)) == [dict(TARGET='first', customkey='first')]
+
+    params.TEMPLATES = ['custom']
+    results = batch(Starter(params, TESTDIR), read_projects(str(projects)), 2)
+    assert [r[3] for r in results] == [
+        None, None, 'Project target is not defined.']
+
+    with open(str(tmpdir.join('second', 'dir', 'template'))) as f:
+        assert 'second' in f.read()
+    assert op.isfile(str(tmpdir.join('first', 'test_first.ls')))
+
+    # Templates with compiled paths are sent to processes
+    projects.write('{"TARGET": "%s", "customkey": "proc"}' % tmpdir.join('p'))
+    results = batch(
+        Starter(params, TESTDIR), read_projects(str(projects)), 2, True)
+    assert results[0][3] is None
+    assert op.isfile(str(tmpdir.join('p', 'test_proc.ls')))
+
+
+@pytest.mark.parametrize('strategy', [
+    'copy', 'hardlink', 'symlink', 'reflink', 'kernel'])
+def test_materialize(tmpdir, strategy):
+    from starter.fs import materialize
+
+    source, target = tmpdir.join('source'), tmpdir.join('target')
+    source.write('data')
+    source.chmod(0o755)
+    materialize(str(source), str(target), strategy)
+    assert target.read() == 'data'
+    assert os.access(str(target), os.X_OK)
+
+    materialize(str(source), str(target))
+    assert not target.islink()
+    target.write('changed')
+    assert source.read() == 'data'
+
+
+def test_template_paths(params, tmpdir):
+    source = tmpdir.join('templates', 'paths')
+    source.ensure('starter.ini')
+    source.ensure('{{ NAME|lower }}', '{% if MAIN %}main{% endif %}.py.j2')
+    source.ensure('static', 'file')
+
+    template = Template('paths', str(source))
+    paths = dict((rel, expr) for _, rel, expr in template.paths)
+    assert paths[op.join('static', 'file')] is None
+    assert template.paths is template.paths
+
+    template.paste(_TRGDIR=str(tmpdir.join('target')), NAME='Pkg', MAIN=1)
+    assert read_tree(str(tmpdir.join('target'))) == {
+        'pkg/main.py': b'', 'static/file': b''}
+
+
+def test_starter_update(params, tmpdir):
+    params.TEMPLATES = ['custom']
+    params.TARGET = str(tmpdir)
+
+    def paste(**context):
+        starter = Starter(params, TESTDIR, update=True)
+        starter.parser.default.update(context)
+        return sorted(
+            op.relpath(f, params.TARGET) for fs in starter.copy() for f in fs)
+
+    assert paste() == [
+        'dir/file', 'dir/template', 'root_file', 'some_file', 'test',
+        'test_customvalue.ls']
+    assert op.isfile(str(tmpdir.join('.starter-manifest')))
+
+    # Sources are hashed by the shared index
+    import json
+    with open(str(tmpdir.join('.starter-manifest'))) as f:
+        assert list(json.load(f)) == ['files']
+
+    template = tmpdir.join('dir', 'template')
+    mtime = template.mtime()
+    assert paste() == []
+
+    assert paste(customkey='changed') == ['dir/template', 'test_changed.ls']
+    assert 'changed' in template.read()
+
+    tmpdir.join('root_file').write('modified')
+    assert paste(customkey='changed') == ['root_file']
+
+    tmpdir.join('.starter-manifest').remove()
+    template.setmtime(mtime - 100)
+    assert 'dir/template' in paste(customkey='changed')
+    assert template.mtime() == mtime - 100
+
+
+def test_source_index_threads(tmpdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from starter.cache import SourceIndex
+
+    index = SourceIndex(str(tmpdir.join('files.json')))
+    paths = []
+    for n in range(200):
+        paths.append(str(tmpdir.join('file{0}.j2'.format(n))))
+        tmpdir.join('file{0}.j2'.format(n)).write('{{ n }}')
+
+    def work(offset):
+        for path in paths[offset::4]:
+            index.kind(path)
+            index.save()
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(work, range(4)))
+
+    index.save()
+    assert len(SourceIndex(index.filename).sources) == 200
+
+
+def test_output_cache(params, tmpdir):
+    from starter.cache import OutputCache, get_output_cache
+
+    cache = OutputCache(str(tmpdir.join('cache')))
+    starter = Starter(params, TESTDIR)
+    templates = [starter.get_template('custom')]
+    context = dict(customkey='value', _DATETIME=1, _TRGDIR='/a')
+
+    # dir/template uses _TRGDIR, but not _DATETIME
+    key = cache.key(templates, context)
+    assert cache.key(templates, dict(context, _DATETIME=2)) == key
+    assert cache.key(templates, dict(context, _TRGDIR='/b')) != key
+    assert cache.key(templates, dict(context, customkey='other')) != key
+
+    params.TEMPLATES = ['custom']
+    params.TARGET = str(tmpdir.join('first'))
+    files = Starter(params, TESTDIR, cache_outputs=True).copy()
+    assert len(files) == 3
+    tree = read_tree(params.TARGET)
+
+    def relpaths(files):
+        return [[op.relpath(f, params.TARGET) for f in ff] for ff in files]
+
+    rels = relpaths(files)
+
+    params.TARGET = str(tmpdir.join('second'))
+    files = Starter(params, TESTDIR, cache_outputs=True).copy()
+    assert len(files) == 3
+
+    # The target is keyed, so paste the same target again
+    import shutil
+    shutil.rmtree(str(tmpdir.join('first')))
+    params.TARGET = str(tmpdir.join('first'))
+    files = Starter(
+        params, TESTDIR, cache_outputs=True, materialize='symlink').copy()
+    assert relpaths(files) == rels
+    assert read_tree(params.TARGET) == tree
+
+    cache = get_output_cache()
+    assert len(os.listdir(cache.directory)) == 4
+    cache.max_size = 0
+    cache.prune()
+    assert os.listdir(cache.directory) == []
+
+    # Cached files are not linked
+    assert read_tree(params.TARGET) == tree
+    assert not any(op.islink(f) for ff in files for f in ff)
+
+    # Permissions of sources are keyed
+    templates = tmpdir.join('templates')
+    shutil.copytree(TESTDIR, str(templates))
+    template = Template('custom', dirs=[str(templates)])
+    key = cache.key([template], context)
+    templates.join('custom', 'root_file').chmod(0o755)
+    assert cache.key([template], context) != key
+
+
+def test_bundle(params, tmpdir):
+    import shutil
+    from starter.bundle import pack
+
+    params.TEMPLATES = ['custom']
+    params.TARGET = str(tmpdir.join('target'))
+    Starter(params, TESTDIR).copy()
+    tree = read_tree(params.TARGET)
+    shutil.rmtree(params.TARGET)
+
+    bundle = str(tmpdir.join('custom.zip'))
+    templates = pack(Starter(params, TESTDIR), bundle)
+    assert [t.name for t in templates] == ['include', 'john', 'custom']
+
+    params.TEMPLATES = [bundle]
+    starter = Starter(params)
+    templates = starter.prepare_templates()
+    assert [t.name for t in templates] == ['include', 'john', 'custom']
+    assert starter.parser.default['iam'] == 'john'
+
+    starter.copy()
+    assert read_tree(params.TARGET) == tree
+
+    shutil.rmtree(params.TARGET)
+    Starter(params, workers=2, processes=True).copy()
+    assert read_tree(params.TARGET) == tree
+
+    # Repacked bundle is read again
+    templates = tmpdir.join('templates')
+    shutil.copytree(TESTDIR, str(templates))
+    templates.join('custom', 'dir', 'template.j2').write(
+        'repacked {{ customkey }}')
+    params.TEMPLATES = ['custom']
+    pack(Starter(params, str(templates)), bundle)
+
+    shutil.rmtree(params.TARGET)
+    params.TEMPLATES = [bundle]
+    Starter(params).copy()
+    assert read_tree(params.TARGET)[op.join('dir', 'template')] == (
+        b'repacked customvalue')
+
+
+def test_graph():
+    from collections import namedtuple
+    from starter.graph import Graph
+
+    T = namedtuple('T', 'name path includes')
+    includes = dict(
+        app=['base', 'lib'], lib=['base', 'license'], base=['license'],
+        license=[], loop=['loop2'], loop2=['loop'])
+    loaded = []
+
+    def get_template(name):
+        loaded.append(name)
+        return T(name, name, includes[name])
+
+    graph = Graph(get_template)
+    order = graph.resolve('app', 'lib')
+    assert [t.name for t in order] == ['license', 'base', 'lib', 'app']
+    assert list(graph.templates) == ['app', 'base', 'license', 'lib']
+    assert sorted(loaded) == sorted(set(loaded))
+    assert not graph.cycles
+
+    graph = Graph(get_template)
+    assert [t.name for t in graph.resolve('loop')] == ['loop2', 'loop']
+    assert graph.cycles == [['loop', 'loop2', 'loop']]
+    assert 'cycle: loop -> loop2 -> loop' in str(graph)
+
+
+def test_starter_lookup(params, tmpdir, monkeypatch):
+    from starter.index import INDEX
+
+    first, second = tmpdir.mkdir('first'), tmpdir.mkdir('second')
+    for dd in (first, second):
+        dd.mkdir('same').join('starter.ini').write('')
+    first.mkdir('other').join('starter.ini').write('')
+
+    scans = []
+    scan = INDEX.scan
+    monkeypatch.setattr(INDEX, 'scan', lambda p: scans.append(p) or scan(p))
+
+    starter = Starter(params, str(first), str(second))
+    assert starter.get_template('same').path == str(second.join('same'))
+    assert starter.get_template('other').path == str(first.join('other'))
+    with pytest.raises(ValueError):
+        starter.get_template('unknown')
+    assert len(scans) == len(starter.dirs)
+
+    starter.dirs.remove(str(second))
+    assert starter.get_template('same').path == str(first.join('same'))
+
+
+def test_profile(params, tmpdir):
+    import json
+    from starter import profile
+
+    params.TEMPLATES = ['custom']
+    params.TARGET = str(tmpdir.join('target'))
+
+    profiler = profile.Profiler()
+    profile.add_hook(profiler)
+    try:
+        Starter(params, TESTDIR, workers=2, processes=True).copy()
+    finally:
+        profile.remove_hook(profiler)
+
+    assert set(['config', 'resolve', 'configure', 'interpolate',
+                'paste:custom']) <= set(profiler.phases)
+    assert len(profiler.files) == 6
+    assert 'Files: 6' in profiler.summary()
+
+    report = str(tmpdir.join('report.json'))
+    profiler.dump(report)
+    with open(report) as f:
+        report = json.load(f)
+    assert report['bytes'] == sum(f['size'] for f in report['files']) > 0
+
+
+def test_server(params, tmpdir, monkeypatch):
+    import json
+    import threading
+    from starter.index import INDEX
+    from starter.server import make_server
+
+    try:
+        from urllib.error import HTTPError
+        from urllib.request import urlopen
+    except ImportError:
+        from urllib2 import HTTPError, urlopen
+
+    with pytest.raises(ValueError):
+        make_server(Starter(params, TESTDIR), '0.0.0.0:0')
+
+    server = make_server(
+        Starter(params, TESTDIR, serve_root=str(tmpdir)), '127.0.0.1:0')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+
+    def paste(**request):
+        return json.loads(urlopen(
+            url + '/paste', json.dumps(request).encode('utf-8')).read().decode(
+                'utf-8'))
+
+    try:
+        response = paste(templates=['custom'], target='a')
+        assert response['templates'] == ['include', 'john', 'custom']
+        assert 'test_customvalue.ls' in response['files']
+        assert tmpdir.join('a', 'test_customvalue.ls').exists()
+
+        # Templates, the lookup and configurations are kept
+        scans = []
+        scan = INDEX.scan
+        monkeypatch.setattr(
+            INDEX, 'scan', lambda p: scans.append(p) or scan(p))
+        templates = dict(server.service.templates)
+        assert op.join(TESTDIR, 'custom', 'starter.ini') in (
+            server.service.configs)
+        response = paste(
+            templates='custom', target=str(tmpdir.join('b')),
+            context=dict(customkey='other'))
+        assert 'test_other.ls' in response['files']
+        assert server.service.templates == templates
+        assert not scans
+
+        with pytest.raises(HTTPError) as info:
+            paste(templates=['custom'], target=str(tmpdir.join('..', 'c')))
+        assert info.value.code == 400
+
+        names = json.loads(urlopen(url + '/templates').read().decode('utf-8'))
+        assert 'custom' in [t['name'] for t in names['templates']]
+
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_render(params, tmpdir, cachedir):
+    from starter.core import render
+
+    # Nothing is written to the disk (caches too)
+    files = render(['custom'], dict(customkey='customvalue'), [TESTDIR])
+    assert not os.listdir(cachedir)
+
+    params.TEMPLATES = ['custom']
+    params.TARGET = str(tmpdir)
+    Starter(params, TESTDIR).copy()
+    assert os.listdir(cachedir)
+
+    tree = read_tree(str(tmpdir))
+    assert sorted(files) == sorted(tree)
+
+    # Target is empty in memory
+    template = op.join('dir', 'template')
+    assert files.pop(template) == tree.pop(template).replace(
+        str(tmpdir).encode('utf-8'), b'')
+    assert files == tree
+    assert render(['custom'], dict(customkey='other'), [TESTDIR])[
+        'test_other.ls'] == files['test_customvalue.ls']
+
+
+@pytest.mark.parametrize('name', ['project.tar.gz', 'project.zip'])
+def test_output_archive(params, tmpdir, name):
+    import tarfile
+    import zipfile
+    from starter.archive import ArchiveFS
+
+    params.TEMPLATES = ['custom']
+    params.TARGET = str(tmpdir.join('target'))
+    Starter(params, TESTDIR).copy()
+    tree = read_tree(params.TARGET)
+
+    filename = str(tmpdir.join(name))
+    with ArchiveFS(filename, params.TARGET) as fs:
+        Starter(params, TESTDIR).copy(fs=fs)
+
+    if name.endswith('.zip'):
+        with zipfile.ZipFile(filename) as archive:
+            files = dict(
+                (i.filename, archive.read(i)) for i in archive.infolist())
+            mode = archive.getinfo('root_file').external_attr >> 16
+    else:
+        with tarfile.open(filename) as archive:
+            files = dict(
+                (i.name, archive.extractfile(i).read())
+                for i in archive.getmembers())
+            mode = archive.getmember('root_file').mode
+
+    assert files == tree
+    assert mode & 0o777 == os.stat(
+        op.join(TESTDIR, 'custom', 'root_file')).st_mode & 0o777
+
+
+def test_watch(params, tmpdir):
+    from starter.watch import Watcher
+
+    source = tmpdir.join('templates', 'watched')
+    source.join('starter.ini').write('name = first', ensure=True)
+    source.join('page.j2').write('{% include "part" %}')
+    source.join('part').write('part')
+    source.join('name.j2').write('{{ name }}')
+
+    params.TEMPLATES = ['watched']
+    params.TARGET = str(tmpdir.join('target'))
+    watcher = Watcher(Starter(params, str(tmpdir.join('templates'))))
+    assert len(watcher.paste()) == 3
+    assert watcher.check() == []
+
+    def change(name, content):
+        source.join(name).write(content)
+        source.join(name).setmtime(source.join(name).mtime() + 10)
+        return sorted(op.relpath(f, params.TARGET) for f in watcher.check())
+
+    assert change('part', 'changed') == ['page', 'part']
+    assert tmpdir.join('target', 'page').read() == 'changed'
+    assert change('name.j2', '{{ name }}!') == ['name']
+    assert change('starter.ini', 'name = second') == ['name', 'page', 'part']
+    assert tmpdir.join('target', 'name').read() == 'second!'
+
+    # Only used items are in the context, templates which use other items
+    # are pasted with the whole paste
+    change('starter.ini', 'name = second\nother = third')
+    assert 'other' not in watcher.context
+    assert change('name.j2', '{{ other }}') == ['name', 'page', 'part']
+    assert tmpdir.join('target', 'name').read() == 'third'
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith('linux'), reason='Inotify is Linux only')
+def test_inotify(tmpdir):
+    from starter.watch import Inotify
+
+    notifier = Inotify()
+    try:
+        notifier.add(str(tmpdir))
+        assert not notifier.wait(0)
+
+        # Created directories are watched
+        tmpdir.mkdir('new').mkdir('nested')
+        assert notifier.wait(1)
+        assert str(tmpdir.join('new', 'nested')) in notifier.watches
+        tmpdir.join('new', 'nested', 'file').write('data')
+        assert notifier.wait(1)
+
+    finally:
+        notifier.close()
+
+
+def test_sources(params, tmpdir):
+    import subprocess
+    import tarfile
+
+    repo = tmpdir.join('repo')
+    repo.join('gitted', 'starter.ini').write('name = first', ensure=True)
+    repo.join('gitted', 'file.j2').write('{{ name }}')
+
+    def git(*args):
+        subprocess.check_call(
+            ('git', '-C', str(repo), '-c', 'user.name=starter',
+             '-c', 'user.email=starter@example.com') + args,
+            stdout=subprocess.PIPE)
+
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'first')
+    git('tag', 'v1')
+    repo.join('gitted', 'starter.ini').write('name = second')
+    git('commit', '-q', '-am', 'second')
+    repo.join('gitted', 'starter.ini').write('name = uncommitted')
+
+    params.TEMPLATES = ['gitted']
+    params.TARGET = str(tmpdir.join('target'))
+    for source, name in ((str(repo), 'second'), (str(repo) + '@v1', 'first')):
+        params.source = source
+        starter = Starter(params)
+        starter.copy()
+        assert tmpdir.join('target', 'file').read() == name
+        assert Starter(params).dirs == starter.dirs
+
+    params.source = str(repo) + '@unknown'
+    with pytest.raises(ValueError):
+        Starter(params)
+
+    tarball = str(tmpdir.join('templates.tar.gz'))
+    with tarfile.open(tarball, 'w:gz') as tar:
+        tar.add(str(repo.join('gitted')), 'templates-1.0/tarred')
+    params.source = 'file://' + tarball
+    params.TEMPLATES = ['tarred']
+    Starter(params).copy()
+    assert tmpdir.join('target', 'file').read() == 'uncommitted'
+    params.source = None
+
+
+def test_lazy_context(params, tmpdir, monkeypatch):
+    from starter import providers
+
+    calls = []
+    monkeypatch.setitem(
+        providers.PROVIDERS, '_LAZY', lambda s: calls.append(s) or 'lazy')
+
+    source = tmpdir.join('templates', 'lazy')
+    source.join('starter.ini').write(
+        'used = {{ _LAZY }}\nunused = {{ _DATETIME }}', ensure=True)
+    source.join('file.j2').write('{{ used }}{{ _LAZY }}')
+
+    params.TEMPLATES = ['lazy']
+    params.TARGET = str(tmpdir.join('target'))
+    starter = Starter(params, str(tmpdir.join('templates')))
+    templates = starter.prepare_templates()
+    assert starter.get_names(templates) == set(['used', '_LAZY'])
+
+    starter.copy(templates)
+    assert calls == [starter]
+    assert tmpdir.join('target', 'file').read() == 'lazylazy'
+    assert '_DATETIME' not in starter.parser.default
+
+    # Prompt only used items
+    prompts = []
+    monkeypatch.setattr(
+        'starter.core.input', lambda p: prompts.append(p) or '',
+        raising=False)
+    params.interactive = True
+    try:
+        Starter(params, str(tmpdir.join('templates'))).copy()
+    finally:
+        params.interactive = False
+    assert [p.split(b' ')[0] for p in prompts] == [b'used']
+
+
+def test_static_templates(params, tmpdir, monkeypatch):
+    from jinja2 import Environment
+    from starter import core
+
+    contents = dict(
+        static=(b'plain text', core.STATIC),
+        text=(b'line\r\nline\n', core.TEXT),
+        template=(b'{{ 1 + 1 }}\n', core.TEMPLATE),
+        binary=(b'\x89PNG\x00\xff', core.BINARY))
+    source = tmpdir.join('templates', 'static')
+    source.join('starter.ini').write('', ensure=True)
+    for name, (content, _) in contents.items():
+        source.join(name + '.j2').write_binary(content)
+
+    renders = []
+    monkeypatch.setattr('starter.plan.render_file', lambda *args: (
+        renders.append(args[1]), core.FS.open_file(args[2]).close()))
+
+    params.TEMPLATES = ['static']
+    params.TARGET = str(tmpdir.join('target'))
+    starter = Starter(params, str(tmpdir.join('templates')))
+    t = starter.prepare_templates()[0]
+    starter.copy()
+    assert renders == ['template.j2']
+
+    env = Environment()
+    for name, (content, kind) in contents.items():
+        assert t.kind(str(source.join(name + '.j2'))) == kind
+        if kind in (core.STATIC, core.TEXT):
+            rendered = env.from_string(content.decode('utf-8')).render()
+            assert tmpdir.join('target', name).read_binary() == \
+                rendered.encode('utf-8')
+    assert tmpdir.join('target', 'binary').read_binary() == \
+        contents['binary'][0]
+
+
+def test_templates_modes(params, tmpdir):
+    source = tmpdir.join('templates', 'modes')
+    source.join('starter.ini').write('', ensure=True)
+    contents = dict(a=b'echo a', b=b'echo b\n', c=b'echo {{ 1 }}\n')
+    for name, content in contents.items():
+        source.join(name + '.sh.j2').write_binary(content)
+        source.join(name + '.sh.j2').chmod(0o755)
+
+    params.TEMPLATES = ['modes']
+    params.TARGET = str(tmpdir.join('target'))
+    for update in (False, True):
+        Starter(params, str(tmpdir.join('templates')), update=update).copy()
+        for name in contents:
+            path = str(tmpdir.join('target', name + '.sh'))
+            assert os.stat(path).st_mode & 0o777 == 0o755
+
+
+def test_plan(params, tmpdir, monkeypatch):
+    from starter import core
+
+    templates = tmpdir.join('templates')
+    templates.join('base', 'starter.ini').write('', ensure=True)
+    templates.join('base', 'Makefile.j2').write('base {{ templates }}')
+    templates.join('base', 'dir', 'file').write('base', ensure=True)
+    templates.join('child', 'starter.ini').write(
+        '[params]\ninclude = base', ensure=True)
+    templates.join('child', 'Makefile.j2').write('child {{ templates }}')
+
+    params.TEMPLATES = ['child']
+    params.TARGET = str(tmpdir.join('target'))
+    starter = Starter(params, str(templates), dry_run=True)
+    templates = starter.prepare_templates()
+    plan = starter.plan(templates, dict(_TRGDIR=params.TARGET))
+    assert [(op.relpath(target, params.TARGET), t.name, action)
+            for target, (t, _, _, action) in plan.operations.items()] == [
+        ('dir/file', 'base', 'copy'), ('Makefile', 'child', 'render')]
+    assert list(plan.replaced.values()) == [['base']]
+    assert plan.directories == [params.TARGET, op.join(params.TARGET, 'dir')]
+    assert 'Makefile (child: Makefile.j2) replaces base' in str(plan)
+
+    # Dry run doesn't paste
+    assert starter.copy(templates) == []
+    assert not tmpdir.join('target').exists()
+
+    renders = []
+    monkeypatch.setattr('starter.plan.render_file', lambda *args: (
+        renders.append(args[0]), core.FS.open_file(args[2]).close()))
+    assert Starter(params, str(tmpdir.join('templates'))).copy() == [
+        [op.join(params.TARGET, 'dir', 'file')],
+        [op.join(params.TARGET, 'Makefile')]]
+    assert renders == [str(tmpdir.join('templates', 'child'))]
+
+
+def test_hooks(params, tmpdir):
+    from starter import hooks
+
+    # Independent hooks wait for each other, so they pass only when they
+    # are run concurrently
+    templates = tmpdir.join('templates')
+    templates.join('base', 'starter.ini').write(
+        '[hook:init]\ncommand = echo {{ NAME }} > init.txt', ensure=True)
+    templates.join('child', 'starter.ini').write('\n'.join([
+        '[params]', 'include = base',
+        '[hook:first]', 'requires = init', 'timeout = 10',
+        'command = touch first; while [ ! -e second ]; do sleep 0.01; done;'
+        ' cat init.txt > first.txt',
+        '[hook:second]', 'timeout = 10',
+        'command = touch second; while [ ! -e first ]; do sleep 0.01; done;'
+        ' echo second > second.txt',
+    ]), ensure=True)
+
+    params.TEMPLATES = ['child']
+    params.TARGET = str(tmpdir.join('target'))
+    starter = Starter(params, str(templates))
+    starter.parser.default['NAME'] = 'hooked'
+    starter.copy()
+    assert tmpdir.join('target', 'first.txt').read() == 'hooked\n'
+    assert tmpdir.join('target', 'second.txt').read() == 'second\n'
+
+    # The slow hook is killed long before it could finish
+    slow = hooks.Hook('slow', 'echo started; sleep 60', timeout=0.2)
+    after = hooks.Hook('after', 'echo after', requires=['slow'])
+    failed = hooks.Hook('failed', 'echo oops; exit 1')
+    with pytest.raises(hooks.HookError):
+        hooks.run_hooks(dict(slow=slow, after=after, failed=failed), '.')
+    assert (slow.status, after.status) == (hooks.TIMEOUT, hooks.SKIPPED)
+    assert slow.seconds < 60 and slow.output == 'started\n'
+    assert (failed.status, failed.output) == (hooks.FAILED, 'oops\n')
+
+
+def test_hooks_quoting(params, tmpdir):
+    from starter.server import Service
+
+    templates = tmpdir.join('templates')
+    templates.join('greet', 'starter.ini').write(
+        '[hook:greet]\ncommand = echo {{ NAME }} > greet.txt', ensure=True)
+
+    # Context values can't inject commands
+    params.TEMPLATES = ['greet']
+    params.TARGET = str(tmpdir.join('target'))
+    starter = Starter(params, str(templates))
+    starter.parser.default['NAME'] = "hi; touch pwned $(touch pwned) '"
+    starter.copy()
+    assert tmpdir.join('target', 'greet.txt').read() == \
+        "hi; touch pwned $(touch pwned) '\n"
+    assert not tmpdir.join('target', 'pwned').exists()
+
+    # Server runs hooks only when they are enabled
+    request = dict(templates=['greet'], target=str(tmpdir.join('served')))
+    Service(Starter(
+        params, str(templates), serve_root=str(tmpdir))).paste(request)
+    assert not tmpdir.join('served', 'greet.txt').exists()
+    Service(Starter(
+        params, str(templates), serve_root=str(tmpdir),
+        serve_hooks=True)).paste(request)
+    assert tmpdir.join('served', 'greet.txt').exists()
+
+
 def test_template_not_found(params):
     params.TEMPLATES = ['custom2']
     starter = Starter(params, TESTDIR)